@@ -1,16 +1,26 @@
 import streamlit as st
-import sqlite3
-from datetime import datetime
+import streamlit.components.v1 as components
+import atexit
+import calendar
+from datetime import date, datetime
 import os
-from PIL import Image
-import pandas as pd
 import json
 import time
-import functools
+import uuid
 import logging
-import re
-from google.cloud import storage
+from contextlib import contextmanager
 from io import BytesIO
+from db import ConnectionPool
+from scans import SCAN_DISK_CACHE_BYTES, DiskCache, ScanCache, pick_derivative
+from scan_server import SCAN_DELIVERY, SCAN_SERVER_URL, serve_scans, url_expiry
+from scan_storage import open_storage, storage_path
+from cleaning import clean_text_content, format_letter_html
+from tracing import tracer_from_env
+from search import (
+    MATCH_MODES, PAGE_SIZE, SORT_OPTIONS, build_count_query, build_highlight_query, build_search_query,
+    build_suggestion_query, build_timeline_query, build_vocab_query, closest_terms, expand_fuzzy_query,
+    fuzzy_distance, fuzzy_terms, incremental_query, last_word_prefix, marks_to_html, snippet_html,
+)
 
 # Configure Streamlit page
 st.set_page_config(
@@ -52,6 +62,14 @@ st.markdown("""
         padding-top: 2rem;
     }
     
+    /* Compact timeline buttons, unlike the full-width letter buttons */
+    section[data-testid="stSidebar"] .stButton > button {
+        padding: 0.25rem 0.5rem !important;
+        box-shadow: none !important;
+        justify-content: center !important;
+        font-size: 0.85rem;
+    }
+    
     /* Input fields styling */
     .stTextInput input, .stDateInput input {
         background-color: white !important;
@@ -154,69 +172,259 @@ st.markdown("""
 # Add debug mode toggle to sidebar
 debug_mode = st.sidebar.checkbox("Enable Debug Mode", value=False)
 
-# Create a placeholder for debug logs in sidebar
-if debug_mode:
-    debug_log = st.sidebar.empty()
-    
-# Store timing information
-timing_logs = []
+# Deep-zoom viewer for scans with a tile pyramid (see init_db.py). Its tiles
+# come from the scan server, so it is only offered once SCAN_SERVER_URL says
+# where browsers can reach that server.
+ZOOM_ENABLED = bool(SCAN_SERVER_URL)
+OPENSEADRAGON_URL = "https://cdn.jsdelivr.net/npm/openseadragon@4.1.0/build/openseadragon/"
+ZOOM_VIEWER_HEIGHT = 700
 
-def log_timing(message):
-    if debug_mode:
-        timing_logs.append(message)
-        debug_log.write("\n".join(timing_logs))
-
-def timer_decorator(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        duration = end_time - start_time
-        log_timing(f"{func.__name__} took {duration:.2f} seconds")
-        return result
-    return wrapper
-
-@timer_decorator
+# Distinct (search, date range, sort, page) results kept in memory per process
+QUERY_CACHE_ENTRIES = int(os.getenv('QUERY_CACHE_ENTRIES', '256'))
+
+# Search while typing: the search box reports its text after this pause,
+# the last word is searched as a prefix and completed from the index
+# vocabulary. SEARCH_AS_YOU_TYPE=0 falls back to searching on Enter.
+SEARCH_AS_YOU_TYPE = os.getenv('SEARCH_AS_YOU_TYPE', '1') == '1'
+SEARCH_DEBOUNCE_MS = int(os.getenv('SEARCH_DEBOUNCE_MS', '300'))
+# Completions kept per process, one entry per typed prefix
+SUGGESTION_CACHE_ENTRIES = int(os.getenv('SUGGESTION_CACHE_ENTRIES', '1024'))
+
+search_box = components.declare_component(
+    "search_box", path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "search_box")
+)
+
+@st.cache_resource
+def get_tracer():
+    """Latency histograms shared by every session, exported as the TRACE_* settings say"""
+    return tracer_from_env()
+
+tracer = get_tracer()
+
+@st.cache_resource
+def get_db_pool():
+    """One read-only connection pool per server process, shared by all sessions"""
+    pool = ConnectionPool()
+    atexit.register(pool.close)
+    return pool
+
+@contextmanager
 def get_db_connection():
-    conn = sqlite3.connect('letters.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_image_from_gcs(bucket_name, blob_path):
-    """Get image from Google Cloud Storage"""
-    if 'image_cache' not in st.session_state:
-        st.session_state.image_cache = {}
+    with get_db_pool().connection() as conn:
+        yield conn
+
+def get_import_generation():
+    """Bumped by init_db.py whenever letters change; keys every cached query result"""
+    with get_db_connection() as conn:
+        row = conn.execute("SELECT value FROM archive_meta WHERE key = 'import_generation'").fetchone()
+    return row['value'] if row else 0
+
+@st.cache_data
+def get_archive_meta(generation):
+    """Date bounds, letter count and schema version, read once per import generation"""
+    with get_db_connection() as conn:
+        return {row['key']: row['value'] for row in conn.execute("SELECT key, value FROM archive_meta")}
+
+@st.cache_data
+def get_people(generation):
+    """Everyone letters are from or to, with how many they sent and received"""
+    with get_db_connection() as conn:
+        rows = conn.execute("""
+            SELECT p.id, p.name, SUM(lp.role = 'from') AS sent, SUM(lp.role = 'to') AS received
+            FROM people p JOIN letter_people lp ON lp.person_id = p.id
+            GROUP BY p.id
+            ORDER BY p.name
+        """).fetchall()
+    return {row['id']: dict(row) for row in rows}
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def fetch_letter_page(search_query, start_date, end_date, order_by, cursor, generation,
+                      senders=(), recipients=(), match_mode="words"):
+    """One page of results plus the total match count, shared by all sessions.
     
-    cache_key = f"{bucket_name}/{blob_path}"
+    Arguments are the cache key: passing the import generation means a
+    re-import invalidates every cached page without any explicit clearing.
+    """
+    count_query, count_params = build_count_query(
+        search_query, start_date, end_date, senders, recipients, match_mode
+    )
+    query, params = build_search_query(
+        search_query, start_date, end_date, order_by, after=cursor, page_size=PAGE_SIZE,
+        senders=senders, recipients=recipients, match_mode=match_mode
+    )
+    with tracer.span("query.sql"), get_db_connection() as conn:
+        result_count = conn.execute(count_query, count_params).fetchone()[0]
+        rows = [dict(row) for row in conn.execute(query, params)]
+    return result_count, rows
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_timeline(search_query, granularity, first, last, generation, senders=(), recipients=(),
+                 match_mode="words"):
+    """Matching letters per year or month: a summary table lookup, or one grouped query"""
+    query, params = build_timeline_query(
+        search_query, granularity, first, last, senders, recipients, match_mode
+    )
+    with tracer.span("timeline.sql"), get_db_connection() as conn:
+        return [tuple(row) for row in conn.execute(query, params)]
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_letter(letter_id, generation):
+    """Body and scan list of one letter, fetched only once it is expanded"""
+    with tracer.span("letter.sql"), get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT content_html, scan_paths FROM letters WHERE id = ?", (letter_id,)
+        ).fetchone()
+    return dict(row) if row else None
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_related_letters(letter_id, generation):
+    """The letters most similar to this one, precomputed by init_db.py"""
+    with tracer.span("related.sql"), get_db_connection() as conn:
+        rows = conn.execute("""
+            SELECT l.id, l.date, l.date_precision, l.description
+            FROM related_letters r JOIN letters l ON l.id = r.related_id
+            WHERE r.letter_id = ?
+            ORDER BY r.rank
+        """, (letter_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_fuzzy_expansions(term, generation):
+    """Indexed words within one or two edits of a search word, closest and most common first"""
+    max_distance = fuzzy_distance(term)
+    if not max_distance:
+        return []
+    query, params = build_vocab_query(term, max_distance)
+    with tracer.span("fuzzy.sql"), get_db_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    return closest_terms(term, rows, max_distance)
+
+@st.cache_data(max_entries=SUGGESTION_CACHE_ENTRIES, show_spinner=False)
+def get_suggestions(prefix, generation):
+    """Indexed words starting with what is being typed, in most letters first"""
+    query, params = build_suggestion_query(prefix)
+    with tracer.span("suggest.sql"), get_db_connection() as conn:
+        return [tuple(row) for row in conn.execute(query, params)]
+
+def format_letter_date(row):
+    """Month-only dates are stored on the 1st; don't pretend to know the day"""
+    return row['date'][:7] if row['date_precision'] == 'month' else row['date']
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_highlighted_letter(search_query, letter_id, generation, match_mode="words"):
+    """A letter's content as HTML with every search match marked, via FTS5 highlight()"""
+    query, params = build_highlight_query(search_query, letter_id, match_mode)
+    with tracer.span("highlight.sql"), get_db_connection() as conn:
+        row = conn.execute(query, params).fetchone()
+    if row is None:
+        return None
+    return marks_to_html(format_letter_html(clean_text_content(row[0])))
+
+@st.cache_resource
+def get_scan_cache():
+    """Compressed scan bytes shared by every session in this server process"""
+    return ScanCache()
+
+@st.cache_resource
+def get_disk_cache():
+    """On-disk scan cache shared with other worker processes, or None if disabled"""
+    if SCAN_DISK_CACHE_BYTES <= 0:
+        return None
+    return DiskCache()
+
+@st.cache_resource
+def get_scan_storage():
+    """The scan storage backend chosen by SCAN_STORAGE, one per server process"""
+    return open_storage(disk_cache=get_disk_cache())
+
+@st.cache_resource
+def get_scan_server():
+    """File server for signed scan and tile URLs, started in this process on first use"""
+    return serve_scans(get_scan_storage())
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_scan_url(blob_path, expires):
+    """Direct URL for one scan, reused until the expiry window moves so browsers can cache it"""
+    storage = get_scan_storage()
+    if storage.remote:
+        return storage.signed_url(blob_path, expires)
+    return get_scan_server().signer.sign(blob_path, expires)
+
+@st.cache_data(max_entries=QUERY_CACHE_ENTRIES, show_spinner=False)
+def get_zoom_url(dzi_path, expires):
+    """Signed URL of a deep-zoom descriptor; the viewer requests its tiles with the same signature"""
+    return get_scan_server().signer.sign(dzi_path, expires)
+
+def zoom_viewer_html(dzi_url):
+    """OpenSeadragon viewer for one tile pyramid, loading only the tiles in view"""
+    return f"""
+        <div id="zoom" style="width: 100%; height: {ZOOM_VIEWER_HEIGHT - 16}px; background: #faf6e9;"></div>
+        <script src="{OPENSEADRAGON_URL}openseadragon.min.js"></script>
+        <script>
+            OpenSeadragon({{
+                id: "zoom",
+                prefixUrl: "{OPENSEADRAGON_URL}images/",
+                tileSources: {json.dumps(dzi_url)},
+                showNavigator: true,
+                maxZoomPixelRatio: 2
+            }});
+        </script>
+    """
+
+def fetch_scans(blob_paths, fallbacks=None):
+    """Yield (blob_path, image) for each scan as soon as it is available.
     
-    if cache_key not in st.session_state.image_cache:
-        start_time = time.time()
-        try:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_path)
-            
-            # Download the image into memory
-            image_data = BytesIO()
-            blob.download_to_file(image_data)
-            image_data.seek(0)
-            
-            # Open the image using PIL
-            image = Image.open(image_data)
-            
-            load_time = time.time() - start_time
-            log_timing(f"Loading and caching image {blob_path} took {load_time:.2f} seconds")
-            st.session_state.image_cache[cache_key] = image
-        except Exception as e:
-            st.error(f"Could not load scan from GCS: {blob_path}\nError: {str(e)}")
-            return None
-    else:
-        log_timing(f"Retrieved image {blob_path} from cache")
+    For remote storage, scans in the memory cache come first; the rest are
+    fetched in parallel, from the disk cache when their GCS generation is
+    already there and from Google Cloud Storage otherwise, and yielded in
+    the order they finish. Local scans are mapped straight from disk.
+    A path that cannot be loaded is replaced by ``fallbacks[blob_path]``,
+    if given, which is yielded under the original path.
+    """
+    # Imported here so cold starts don't pay for it until a scan is shown
+    from PIL import Image
     
-    return st.session_state.image_cache[cache_key]
+    try:
+        storage = get_scan_storage()
+    except Exception as e:
+        st.error(f"Could not open scan storage\nError: {str(e)}")
+        return
+    
+    cache = get_scan_cache() if storage.remote else None
+    missing = []
+    for blob_path in blob_paths:
+        fetch_start = time.perf_counter()
+        image_data = cache.get(f"{storage.name}/{blob_path}") if cache is not None else None
+        if image_data is None:
+            missing.append(blob_path)
+        else:
+            tracer.record("image_fetch", time.perf_counter() - fetch_start, path=blob_path, source="memory")
+            yield blob_path, Image.open(BytesIO(image_data))
+    
+    fetch_start = time.perf_counter()
+    retries = {}
+    for blob_path, image_data, error in storage.get_many(missing):
+        if error is not None and fallbacks and blob_path in fallbacks:
+            retries[fallbacks[blob_path]] = blob_path
+            continue
+        if error is not None:
+            st.error(f"Could not load scan from {storage.name}: {blob_path}\nError: {str(error)}")
+            continue
+        if cache is not None:
+            # Disk cache hits are mapped files; a copy lets the mapping and
+            # its file descriptor go once the page is decoded
+            cache.put(f"{storage.name}/{blob_path}", bytes(image_data))
+        # Pages arrive in completion order, so this is each page's time to arrive
+        tracer.record("image_fetch", time.perf_counter() - fetch_start, path=blob_path,
+                      source="remote" if storage.remote else "local")
+        # Decode on demand; only the compressed bytes are kept in the cache
+        yield blob_path, Image.open(BytesIO(image_data))
+    
+    if retries:
+        for fallback_path, image in fetch_scans(list(retries)):
+            yield retries[fallback_path], image
 
-@timer_decorator
+@tracer.traced("images")
 def display_images(scan_paths_str):
     """Display images in a two-column layout"""
     if not scan_paths_str:
@@ -229,20 +437,111 @@ def display_images(scan_paths_str):
             st.markdown("### Original Scans")
             cols = st.columns(min(len(scan_paths), 2))
             
-            # Get bucket name from environment variable
-            bucket_name = os.getenv('GCS_BUCKET_NAME')
+            # Look up the display-size copies made by init_db.py
+            derivatives = {}
+            with get_db_connection() as conn:
+                rows = conn.execute(f"""
+                    SELECT original_path, width, path FROM scan_derivatives
+                    WHERE original_path IN ({','.join('?' * len(scan_paths))})
+                """, scan_paths).fetchall()
+                # And the deep-zoom tile pyramids
+                pyramids = dict(conn.execute(f"""
+                    SELECT original_path, dzi_path FROM scan_tiles
+                    WHERE original_path IN ({','.join('?' * len(scan_paths))})
+                """, scan_paths).fetchall()) if ZOOM_ENABLED else {}
+            for row in rows:
+                derivatives.setdefault(row['original_path'], []).append((row['width'], row['path']))
             
+            # Lay out a placeholder per page, then fill each one as its scan arrives
+            slots = {}
+            # Shown instead of a derivative that cannot be loaded, e.g. when
+            # dataset/derivatives/ was not uploaded alongside the originals
+            originals = {}
             for idx, scan_path in enumerate(scan_paths):
                 col = cols[idx % 2]
                 with col:
-                    # Convert local path to GCS path (remove leading 'dataset/' if present)
-                    gcs_path = scan_path.replace('dataset/', '')
-                    image = get_image_from_gcs(bucket_name, gcs_path)
-                    if image:
-                        st.image(image, caption=os.path.basename(scan_path), use_container_width=True)
+                    zoom_key = f"zoom_{scan_path}"
+                    if scan_path in pyramids and st.session_state.get(zoom_key, False):
+                        # The viewer fetches tiles straight from the scan server
+                        dzi_url = get_zoom_url(storage_path(pyramids[scan_path]), url_expiry())
+                        components.html(zoom_viewer_html(dzi_url), height=ZOOM_VIEWER_HEIGHT)
+                        st.caption(os.path.basename(scan_path))
+                        if st.button("Close zoom", key=f"zoom_close_btn_{scan_path}"):
+                            st.session_state[zoom_key] = False
+                            st.rerun()
+                        continue
+                    
+                    # Only fetch the full-resolution original when asked to
+                    original_key = f"show_original_{scan_path}"
+                    derivative = None
+                    if not st.session_state.get(original_key, False):
+                        derivative = pick_derivative(derivatives.get(scan_path))
+                    
+                    # Storage keys are relative to the dataset directory
+                    blob_path = storage_path(derivative or scan_path)
+                    slots[blob_path] = (st.empty(), os.path.basename(scan_path))
+                    if derivative:
+                        originals[blob_path] = storage_path(scan_path)
+                    if derivative and st.button("Load full resolution", key=f"original_btn_{scan_path}"):
+                        st.session_state[original_key] = True
+                        st.rerun()
+                    if scan_path in pyramids and st.button("Zoom", key=f"zoom_btn_{scan_path}"):
+                        st.session_state[zoom_key] = True
+                        st.rerun()
+            
+            if SCAN_DELIVERY == 'url':
+                # The browser downloads the scans itself; no bytes pass through here
+                expires = url_expiry()
+                with tracer.span("scan_urls", pages=len(slots)):
+                    urls = {blob_path: get_scan_url(blob_path, expires) for blob_path in slots}
+                for blob_path, url in urls.items():
+                    slot, caption = slots[blob_path]
+                    slot.image(url, caption=caption, use_container_width=True)
+                return
+            
+            for blob_path, image in fetch_scans(list(slots), fallbacks=originals):
+                slot, caption = slots[blob_path]
+                slot.image(image, caption=caption, use_container_width=True)
     except Exception as e:
         st.error(f"Error loading images: {e}")
 
+def set_date_range(start, end):
+    """Button callback; runs before the rerun, while the date inputs can still be changed"""
+    st.session_state.start_date = start
+    st.session_state.end_date = end
+
+def show_timeline(search_query, start_date, end_date, min_date, max_date, generation,
+                  senders=(), recipients=(), match_mode="words"):
+    """Letters per year, or per month once the range is within one year, as buttons narrowing the range"""
+    if start_date.year == end_date.year:
+        granularity, first, last = "month", f"{start_date.year}-01", f"{start_date.year}-12"
+    else:
+        granularity, first, last = "year", None, None
+    counts = get_timeline(search_query, granularity, first, last, generation, senders, recipients, match_mode)
+    if not counts:
+        return
+
+    st.sidebar.markdown("### Timeline")
+    st.sidebar.bar_chart(
+        {"period": [period for period, _ in counts], "letters": [letters for _, letters in counts]},
+        x="period", y="letters", height=160
+    )
+    cols = st.sidebar.columns(3)
+    for idx, (period, letters) in enumerate(counts):
+        if granularity == "year":
+            year = int(period)
+            label, start, end = period, date(year, 1, 1), date(year, 12, 31)
+        else:
+            year, month = map(int, period.split("-"))
+            label = calendar.month_abbr[month]
+            start, end = date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+        cols[idx % 3].button(
+            f"{label} · {letters}", key=f"timeline_{period}",
+            on_click=set_date_range, args=(max(start, min_date), min(end, max_date))
+        )
+    if granularity == "month":
+        st.sidebar.button("All years", key="timeline_all", on_click=set_date_range, args=(min_date, max_date))
+
 def check_password():
     """Returns `True` if the user had the correct password."""
 
@@ -275,9 +574,6 @@ def main():
     """Main function containing the app logic"""
     st.title("Family Letters Archive")
     
-    # Initialize database connection
-    conn = get_db_connection()
-    
     # Sidebar styling
     st.sidebar.markdown("""
         <style>
@@ -289,22 +585,63 @@ def main():
     
     st.sidebar.title("Search and Filter")
     
-    # Get min and max dates from database
-    date_range = pd.read_sql_query(
-        "SELECT MIN(date) as min_date, MAX(date) as max_date FROM letters",
-        conn
-    ).iloc[0]
-    
-    min_date = datetime.strptime(date_range['min_date'], '%Y-%m-%d')
-    max_date = datetime.strptime(date_range['max_date'], '%Y-%m-%d')
+    # Date bounds are recorded by init_db.py, no aggregate query needed
+    generation = get_import_generation()
+    archive_meta = get_archive_meta(generation)
+    min_date = datetime.strptime(archive_meta['min_date'], '%Y-%m-%d').date()
+    max_date = datetime.strptime(archive_meta['max_date'], '%Y-%m-%d').date()
     
     # Add search field without icon
-    search_query = st.sidebar.text_input("Search letters", key="search_input")
+    if SEARCH_AS_YOU_TYPE:
+        # The component's last report is in session state before it renders,
+        # so its completions can be looked up in the same rerun. It is
+        # {"text": ..., "final": ...}; final once Enter commits the text.
+        typed = st.session_state.get("search_box") or {"text": "", "final": True}
+        prefix = "" if typed["final"] else last_word_prefix(typed["text"])
+        with st.sidebar:
+            typed = search_box(
+                label="Search letters", value=typed["text"], final=typed["final"],
+                debounce_ms=SEARCH_DEBOUNCE_MS,
+                suggestions=get_suggestions(prefix, generation) if prefix else [],
+                key="search_box", default=typed
+            )
+        search_query, search_final = typed["text"], typed["final"]
+    else:
+        search_query = st.sidebar.text_input("Search letters", key="search_input")
+        search_final = True
+
+    # Correspondents found by init_db.py in filenames, salutations and signatures
+    people = get_people(generation)
+    st.sidebar.markdown("### Correspondents")
+    senders = tuple(st.sidebar.multiselect(
+        "Letters from", [pid for pid, person in people.items() if person['sent']],
+        format_func=lambda pid: f"{people[pid]['name']} ({people[pid]['sent']})", key="senders"
+    ))
+    recipients = tuple(st.sidebar.multiselect(
+        "Letters to", [pid for pid, person in people.items() if person['received']],
+        format_func=lambda pid: f"{people[pid]['name']} ({people[pid]['received']})", key="recipients"
+    ))
 
     # Date range selection with better layout
     st.sidebar.markdown("### Date Range")
-    start_date = st.sidebar.date_input("From", min_value=min_date, max_value=max_date, value=min_date)
-    end_date = st.sidebar.date_input("To", min_value=min_date, max_value=max_date, value=max_date)
+    # Keyed so the timeline can set them; defaults go through session state
+    # too, as a widget may not have both
+    st.session_state.setdefault("start_date", min_date)
+    st.session_state.setdefault("end_date", max_date)
+    start_date = st.sidebar.date_input("From", min_value=min_date, max_value=max_date, key="start_date")
+    end_date = st.sidebar.date_input("To", min_value=min_date, max_value=max_date, key="end_date")
+
+    # Relevance ordering only makes sense when there is something to rank by
+    order_by, match_mode = "date", "words"
+    if search_query:
+        order_by = st.sidebar.radio(
+            "Sort by", SORT_OPTIONS, format_func=str.capitalize, horizontal=True
+        )
+        match_mode = st.sidebar.radio(
+            "Match", MATCH_MODES, format_func=str.capitalize, horizontal=True, key="match_mode",
+            help="Words: whole words. Substring: any part of a word, three letters or more. "
+                 "Fuzzy: also close spellings, for OCR errors and typos."
+        )
 
     try:
         # Validate date range
@@ -312,60 +649,56 @@ def main():
             st.sidebar.error("Start date must be before end date")
             return
 
-        # Modify query to include search
-        query = """
-            SELECT id, date, description, content, scan_paths
-            FROM letters 
-            WHERE date BETWEEN ? AND ?
-        """
-        params = [start_date, end_date]
+        # Keyset pagination: remember the cursor each visited page started
+        # from, and start over whenever the filters change
+        filters = (search_query, search_final, str(start_date), str(end_date), order_by, senders, recipients,
+                   match_mode)
+        if st.session_state.get("page_filters") != filters:
+            st.session_state.page_filters = filters
+            st.session_state.page_cursors = [None]
+        page_cursors = st.session_state.page_cursors
         
-        if search_query:
-            query += " AND (content LIKE ? OR description LIKE ?)"
-            search_pattern = f"%{search_query}%"
-            params.extend([search_pattern, search_pattern])
-            
-        query += " ORDER BY date DESC"
-        
-        # Execute query and fetch results
-        df = pd.read_sql_query(query, conn, params=params)
+        # Execute query and fetch results, normalizing the search so trivially
+        # different spellings of the same query share a cache entry. Until
+        # Enter commits it, a word still being typed is a prefix; each one is
+        # cached like any search, so typing on or deleting back reuses the
+        # pages already fetched.
+        search_text = search_query
+        if not search_final and match_mode == "words":
+            search_text = incremental_query(search_query)
+        normalized_query = " ".join(search_text.split())
+        if match_mode == "fuzzy":
+            # Rewritten into an ordinary word search, so everything below
+            # (counts, timeline, snippets, highlighting) works unchanged
+            with tracer.span("fuzzy"):
+                expansions = {term: get_fuzzy_expansions(term, generation) for term in fuzzy_terms(normalized_query)}
+            normalized_query = expand_fuzzy_query(normalized_query, expansions)
+            alternatives = [
+                f"{term} → {', '.join(other for other in found if other != term)}"
+                for term, found in expansions.items() if set(found) - {term}
+            ]
+            if alternatives:
+                st.sidebar.caption("Also matching: " + "; ".join(alternatives))
+            match_mode = "words"
+        with tracer.span("timeline"):
+            show_timeline(normalized_query, start_date, end_date, min_date, max_date, generation,
+                          senders, recipients, match_mode)
+        with tracer.span("query", search=bool(normalized_query), order_by=order_by, match=match_mode):
+            result_count, rows = fetch_letter_page(
+                normalized_query, start_date, end_date, order_by, page_cursors[-1], generation,
+                senders, recipients, match_mode
+            )
+        has_next_page = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
         
         # Display result count without emoji
-        result_count = len(df)
-        if search_query:
-            st.markdown(f"### Found {result_count} {'letter' if result_count == 1 else 'letters'} matching '{search_query}'")
+        if normalized_query:
+            # Say so while the last word is still searched as a prefix
+            shown_query = search_text.strip() if search_text != search_query else search_query
+            st.markdown(f"### Found {result_count} {'letter' if result_count == 1 else 'letters'} matching '{shown_query}'")
         else:
             st.markdown(f"### Showing {result_count} {'letter' if result_count == 1 else 'letters'}")
 
-        # Helper function to highlight matching text
-        def highlight_matches(text, search):
-            if not search or not text:
-                return text
-            
-            import re
-            pattern = re.compile(f'({re.escape(search)})', re.IGNORECASE)
-            return pattern.sub(r'**\1**', text)
-
-        # Helper function to clean text content
-        def clean_text_content(text):
-            # Replace special quotes and dashes with standard characters
-            text = text.replace('"', '"').replace('"', '"')
-            text = text.replace(''', "'").replace(''', "'")
-            text = text.replace('–', '-').replace('—', '-')
-            # Fix common OCR issues with spaces
-            text = re.sub(r'(\d+),(\d+)', r'\1,\2', text)  # Fix number formatting
-            text = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', text)  # Add space between letter and number
-            # Remove any non-ASCII characters
-            text = ''.join(char if ord(char) < 128 else ' ' for char in text)
-            
-            # Convert multiple newlines to a single newline
-            text = re.sub(r'\n\s*\n', '\n\n', text)
-            
-            # Fix multiple spaces (but preserve newlines)
-            text = re.sub(r'[^\S\n]+', ' ', text)
-            
-            return text.strip()
-
         # Add custom CSS for letter styling
         st.markdown("""
             <style>
@@ -402,53 +735,123 @@ def main():
             .letter-content p {
                 margin-bottom: 1.5em;
             }
+            .letter-snippet {
+                color: #555;
+                font-size: 0.9rem;
+                padding: 0.25rem 1.5rem 0.75rem;
+            }
+            .letter-snippet mark, .letter-content mark {
+                background-color: #f3e2a9;
+                padding: 0 0.1em;
+            }
             </style>
         """, unsafe_allow_html=True)
 
-        for idx, row in df.iterrows():
-            expander_key = f"show_images_{idx}"
-            if expander_key not in st.session_state:
-                st.session_state[expander_key] = False
+        with tracer.span("render", rows=len(rows)):
+            for row in rows:
+                letter_id = row['id']
 
-            st.markdown('<div class="letter-container">', unsafe_allow_html=True)
+                st.markdown('<div class="letter-container">', unsafe_allow_html=True)
             
-            # Create a button with description and date
-            button_text = f"{row['description']}          {row['date']}"
+                # Create a button with description and date
+                button_text = f"{row['description']}          {format_letter_date(row)}"
             
-            if st.button(
-                button_text,
-                key=f"preview_btn_{idx}",
-                use_container_width=True,
-                type="secondary"
-            ):
-                st.session_state[f"expander_{idx}"] = not st.session_state.get(f"expander_{idx}", False)
-                st.rerun()
-
-            # Show content if expanded
-            if st.session_state.get(f"expander_{idx}", False):
-                # Clean the content
-                cleaned_content = clean_text_content(row['content'])
-                # Replace newlines with paragraph breaks
-                formatted_content = cleaned_content.replace('\n\n', '</p><p>')
-                formatted_content = f'<p>{formatted_content}</p>'
-                
-                st.markdown(f"""
-                    <div class="letter-content">
-                        {formatted_content}
-                    </div>
-                """, unsafe_allow_html=True)
-
-                # Display original letter images if available
-                if row['scan_paths']:
-                    st.write("Original Letter:")
-                    display_images(row['scan_paths'])
+                if st.button(
+                    button_text,
+                    key=f"preview_btn_{letter_id}",
+                    use_container_width=True,
+                    type="secondary"
+                ):
+                    st.session_state[f"expander_{letter_id}"] = not st.session_state.get(f"expander_{letter_id}", False)
+                    st.rerun()
+
+                # Show why the letter matched, excerpted by SQLite in the same query
+                if row['snippet']:
+                    st.markdown(
+                        f'<div class="letter-snippet">{snippet_html(row["snippet"])}</div>',
+                        unsafe_allow_html=True
+                    )
+
+                # Show content if expanded
+                letter = None
+                if st.session_state.get(f"expander_{letter_id}", False):
+                    letter = get_letter(letter_id, generation)
+                if letter:
+                    # Cleaned and formatted at import time by init_db.py
+                    content_html = letter['content_html']
+                    if normalized_query:
+                        content_html = get_highlighted_letter(
+                            normalized_query, letter_id, generation, match_mode
+                        ) or content_html
+                    st.markdown(f"""
+                        <div class="letter-content">
+                            {content_html}
+                        </div>
+                    """, unsafe_allow_html=True)
+
+                    # Display original letter images if available
+                    if letter['scan_paths']:
+                        st.write("Original Letter:")
+                        display_images(letter['scan_paths'])
+
+                    # Similar letters, opened in place since they may be on another page
+                    related = get_related_letters(letter_id, generation)
+                    if related:
+                        st.write("Related letters:")
+                    for other in related:
+                        related_key = f"related_{letter_id}_{other['id']}"
+                        if st.button(
+                            f"{other['description']}          {format_letter_date(other)}",
+                            key=f"related_btn_{letter_id}_{other['id']}",
+                            use_container_width=True
+                        ):
+                            st.session_state[related_key] = not st.session_state.get(related_key, False)
+                            st.rerun()
+                        other_letter = None
+                        if st.session_state.get(related_key, False):
+                            other_letter = get_letter(other['id'], generation)
+                        if other_letter:
+                            st.markdown(f"""
+                                <div class="letter-content">
+                                    {other_letter['content_html']}
+                                </div>
+                            """, unsafe_allow_html=True)
+        
+        # Page through the results
+        page_count = max(1, -(-result_count // PAGE_SIZE))
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if len(page_cursors) > 1 and prev_col.button("Previous", key="page_prev"):
+            page_cursors.pop()
+            st.rerun()
+        page_col.markdown(f"Page {len(page_cursors)} of {page_count}")
+        if has_next_page and next_col.button("Next", key="page_next"):
+            last_row = rows[-1]
+            page_cursors.append((last_row['sort_key'], last_row['id']))
+            st.rerun()
     
     except Exception as e:
         st.error(f"An error occurred: {e}")
 
+def show_debug_info(rerun):
+    """Timings of the last rerun and the process-wide latency percentiles"""
+    st.sidebar.markdown("### Last rerun")
+    st.sidebar.json(rerun.to_dict(), expanded=False)
+    st.sidebar.markdown("### Latency percentiles")
+    st.sidebar.json(tracer.percentiles(), expanded=False)
+    st.sidebar.markdown("### Scan cache")
+    st.sidebar.json(get_scan_cache().stats())
+    if get_disk_cache() is not None:
+        st.sidebar.markdown("### Scan disk cache")
+        st.sidebar.json(get_disk_cache().stats())
+
 if __name__ == "__main__":
+    # One trace per rerun, grouped by session in the exported traces
+    session_id = st.session_state.setdefault("trace_session_id", uuid.uuid4().hex)
     try:
-        if check_password():
-            main()
+        with tracer.trace("rerun", session_id=session_id) as rerun:
+            if check_password():
+                main()
     except Exception as e:
         st.error(f"An error occurred: {e}")
+    if debug_mode:
+        show_debug_info(rerun)
@@ -0,0 +1,50 @@
+"""Compare two benchmark result files metric by metric.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+
+Prints every numeric metric present in both runs with its relative change.
+For ``*_ms`` and ``*_s`` timings lower is better; for ``*_per_s`` rates
+higher is better.
+"""
+import argparse
+import json
+
+# Run metadata that is numeric but not a measurement
+SKIP = {"cpu_count", "page_size"}
+
+
+def flatten(results, prefix=""):
+    """``{"a": {"b": 1}}`` -> ``{"a.b": 1}``, keeping only numeric leaves."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in SKIP:
+            flat[name] = value
+    return flat
+
+
+def compare(old, new):
+    """Yield ``(metric, old, new, change)`` with change as a fraction, or None."""
+    old_flat, new_flat = flatten(old), flatten(new)
+    for name in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[name], new_flat[name]
+        change = (after - before) / before if before else None
+        yield name, before, after, change
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for name, before, after, change in compare(old, new):
+        change_text = "" if change is None else f"{change:+.1%}"
+        print(f"{name:<60} {before:>14} {after:>14} {change_text:>9}")
@@ -0,0 +1,150 @@
+"""Synthetic letters corpus in the layout and filename conventions of dataset/.
+
+Writes ``text/final/<date> <description>.txt`` and
+``originals/<date> <description> - Page i of n.png`` trees that
+``init_db.import_letters()`` imports like the real archive, with OCR-style
+noise (curly quotes, dashes, run-on digits) for the cleaner to work on.
+Generation is deterministic for a given size and seed.
+"""
+import argparse
+import os
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+PEOPLE = (
+    "Harold", "Ruth", "Mother", "Father", "Aunt Edna", "Uncle Walter", "Margaret",
+    "George", "Dorothy", "Frank", "Helen", "Arthur", "Grandma", "Betty", "Charles",
+)
+KINDS = ("Letter", "Letter", "Letter", "Postcard", "Telegram", "Christmas card")
+
+# Common words repeat a lot, rare ones hardly at all, as in real letters;
+# the benchmarks search for both kinds.
+COMMON_WORDS = (
+    "the", "and", "to", "of", "a", "I", "you", "in", "we", "is", "it", "that", "for",
+    "was", "with", "have", "are", "on", "all", "but", "so", "here", "love", "home",
+    "dear", "letter", "write", "today", "week", "weather", "news", "family", "hope",
+    "well", "good", "cold", "rain", "garden", "work", "church", "town", "house",
+)
+RARE_WORDS = (
+    "training", "camp", "coast", "furlough", "tomatoes", "harvest", "wedding",
+    "railroad", "hospital", "convoy", "ration", "telegram", "blizzard", "orchard",
+    "schoolhouse", "parade", "measles", "tractor", "lighthouse", "photograph",
+)
+NOISE = ("“", "”", "’", "—", "…", "  ", " \n")
+
+# Every synthetic scan is the same tiny placeholder page; the import only
+# looks at file names. Full-size pages for decode benchmarks are separate.
+_PLACEHOLDER_SIZE = (32, 44)
+
+
+def _description(rng):
+    kind = rng.choice(KINDS)
+    sender, recipient = rng.sample(PEOPLE, 2)
+    if kind in ("Postcard", "Telegram") and rng.random() < 0.5:
+        return f"{kind} from {sender}"
+    return f"{kind} from {sender} to {recipient}"
+
+
+def _date(rng):
+    year = rng.randint(1900, 1970)
+    month = rng.randint(1, 12)
+    if rng.random() < 0.15:
+        return f"{year}-{month:02d}"  # month-only, as some real letters are
+    return f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+
+
+def letter_text(rng, recipient="friend", sender="Harold"):
+    """One letter body: salutation, a few noisy paragraphs and a sign-off."""
+    paragraphs = [f"Dear {recipient},"]
+    for _ in range(rng.randint(2, 6)):
+        words = []
+        for _ in range(rng.randint(30, 120)):
+            word = rng.choice(RARE_WORDS if rng.random() < 0.005 else COMMON_WORDS)
+            if rng.random() < 0.02:
+                word += str(rng.randint(1, 31))  # OCR run-on, e.g. "item2"
+            if rng.random() < 0.03:
+                word = rng.choice(NOISE) + word
+            words.append(word)
+        paragraphs.append(" ".join(words).capitalize() + ".")
+    paragraphs.append(f"Love,\n{sender}")
+    return "\n\n".join(paragraphs) + "\n"
+
+
+def _placeholder_png():
+    buffer = BytesIO()
+    Image.new("L", _PLACEHOLDER_SIZE, 235).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def generate_corpus(root, letters, seed=0, max_pages=3):
+    """Write ``letters`` synthetic letters and their scans under ``root``.
+
+    Returns ``(text_dir, scan_dir)``. Names that would collide, or whose
+    base name would be a prefix of another's and so pick up its scans, get
+    a number inserted after the kind (``Letter 2 from ...``).
+    """
+    rng = random.Random(seed)
+    text_dir = os.path.join(root, "text", "final")
+    scan_dir = os.path.join(root, "originals")
+    os.makedirs(text_dir, exist_ok=True)
+    os.makedirs(scan_dir, exist_ok=True)
+    placeholder = _placeholder_png()
+
+    seen = set()
+    senders_seen = set()  # "<date> <kind> from <sender>" part of every base with a recipient
+    for _ in range(letters):
+        date = _date(rng)
+        description = _description(rng)
+        kind, rest = description.split(" from ", 1)
+        base = f"{date} {description}"
+        number = 1
+        # "... from Harold" is a prefix of "... from Harold to Ruth"
+        while base in seen or base in senders_seen or base.split(" to ")[0] in seen:
+            number += 1
+            base = f"{date} {kind} {number} from {rest}"
+        seen.add(base)
+        if " to " in base:
+            senders_seen.add(base.split(" to ")[0])
+
+        words = description.split(" from ", 1)[1].split(" to ")
+        sender, recipient = words[0], (words[1] if len(words) > 1 else "friend")
+        with open(os.path.join(text_dir, base + ".txt"), "w", encoding="utf-8") as f:
+            f.write(letter_text(rng, recipient, sender))
+
+        pages = rng.randint(1, max_pages)
+        for page in range(1, pages + 1):
+            with open(os.path.join(scan_dir, f"{base} - Page {page} of {pages}.png"), "wb") as f:
+                f.write(placeholder)
+    return text_dir, scan_dir
+
+
+def make_page_image(width=2550, height=3300, seed=0):
+    """A scan-sized greyscale page with lines of handwriting-like strokes."""
+    rng = random.Random(seed)
+    image = Image.new("L", (width, height), 238)
+    draw = ImageDraw.Draw(image)
+    margin = width // 10
+    line_height = height // 40
+    for y in range(margin, height - margin, line_height):
+        x = margin
+        while x < width - margin:
+            word = rng.randint(line_height // 2, line_height * 3)
+            draw.line(
+                [(x, y + rng.randint(-3, 3)), (min(x + word, width - margin), y + rng.randint(-3, 3))],
+                fill=rng.randint(20, 90), width=max(2, line_height // 8),
+            )
+            x += word + line_height // 2
+    # Paper grain, so the PNG compresses like a photographed page
+    return Image.blend(image, Image.effect_noise((width, height), 12), 0.08)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic letters corpus")
+    parser.add_argument("root", help="directory to create text/final and originals in")
+    parser.add_argument("--letters", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_corpus(args.root, args.letters, args.seed)
+    print(f"Wrote {args.letters} letters to {args.root}")
@@ -0,0 +1,323 @@
+"""Benchmark the import pipeline, related letters, search, text cleaning and scan decoding.
+
+Run from the repository root:
+
+    python -m benchmarks.run --sizes 1000 10000 100000
+
+Each size gets its own synthetic corpus (see ``benchmarks/corpus.py``),
+cached under ``--workdir`` so later runs skip generating it. Results are
+written to ``benchmarks/results/<timestamp>-<commit>.json``; compare two
+runs with ``python -m benchmarks.compare old.json new.json``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks.corpus import generate_corpus, letter_text, make_page_image
+from cleaning import clean_text_content, format_letter_html
+from db import connect_readonly
+from init_db import import_letters, init_db, make_derivatives, update_related_letters
+from scan_storage import LocalStorage
+from search import (
+    PAGE_SIZE, build_count_query, build_search_query, build_suggestion_query, build_timeline_query,
+    build_vocab_query, closest_terms, fuzzy_distance, incremental_query, last_word_prefix,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+# Query type -> (search as typed in the sidebar, LIKE patterns the app used
+# to scan for, and how those patterns combine)
+SEARCHES = {
+    "common_word": ("garden", ["%garden%"], "OR"),
+    "rare_word": ("lighthouse", ["%lighthouse%"], "OR"),
+    "phrase": ('"love home"', ["%love home%"], "OR"),
+    "prefix": ("tract*", ["%tract%"], "OR"),
+    "or": ("convoy OR furlough", ["%convoy%", "%furlough%"], "OR"),
+    "and": ("harvest wedding", ["%harvest%", "%wedding%"], "AND"),
+    "no_match": ("zeppelin", ["%zeppelin%"], "OR"),
+}
+START_DATE, END_DATE = "1900-01-01", "1970-12-31"
+
+
+def _timings(func, repeat):
+    """Run ``func`` ``repeat`` times, returning latency stats in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, round(0.95 * len(samples)) - 1)], 3),
+        "min_ms": round(samples[0], 3),
+    }
+
+
+def bench_import(text_dir, scan_dir, db_path, letters):
+    """Fresh import and a no-op re-import of one corpus."""
+    if os.path.exists(db_path):
+        os.unlink(db_path)
+    init_db(db_path)
+    start = time.perf_counter()
+    import_letters(text_dir, scan_dir, db_path)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    import_letters(text_dir, scan_dir, db_path)
+    again = time.perf_counter() - start
+    return {
+        "import_s": round(first, 3),
+        "import_files_per_s": round(letters / first, 1),
+        "reimport_s": round(again, 3),
+        "reimport_files_per_s": round(letters / again, 1),
+        "db_bytes": os.path.getsize(db_path),
+    }
+
+
+def bench_related(db_path):
+    """Full build of the related-letters index, then a no-op incremental update."""
+    start = time.perf_counter()
+    update_related_letters(db_path, full=True)
+    full = time.perf_counter() - start
+    start = time.perf_counter()
+    update_related_letters(db_path)
+    again = time.perf_counter() - start
+    return {"build_s": round(full, 3), "update_noop_s": round(again, 3)}
+
+
+def _like_search(conn, patterns, combine):
+    # The pre-FTS query: every matching letter, bodies included, no paging
+    condition = f" {combine} ".join(["(content LIKE ? OR description LIKE ?)"] * len(patterns))
+    params = [START_DATE, END_DATE] + [p for pattern in patterns for p in (pattern, pattern)]
+    rows = conn.execute(f"""
+        SELECT id, date, description, content, scan_paths FROM letters
+        WHERE date BETWEEN ? AND ? AND ({condition})
+        ORDER BY date DESC
+    """, params).fetchall()
+    return len(rows)
+
+
+def _fts_search(conn, search_query, order_by, match_mode="words"):
+    # What fetch_letter_page() runs: the total count plus one page
+    count_query, count_params = build_count_query(search_query, START_DATE, END_DATE, match_mode=match_mode)
+    query, params = build_search_query(search_query, START_DATE, END_DATE, order_by, match_mode=match_mode)
+    count = conn.execute(count_query, count_params).fetchone()[0]
+    conn.execute(query, params).fetchall()
+    return count
+
+
+def _correspondent_search(conn, senders, recipients):
+    # "All letters from X to Y in the 1940s": a date range plus two person filters
+    count_query, count_params = build_count_query("", "1940-01-01", "1949-12-31", senders, recipients)
+    query, params = build_search_query("", "1940-01-01", "1949-12-31", senders=senders, recipients=recipients)
+    count = conn.execute(count_query, count_params).fetchone()[0]
+    conn.execute(query, params).fetchall()
+    return count
+
+
+def _fuzzy_expand(conn, term):
+    # What get_fuzzy_expansions() runs per word before a fuzzy search
+    distance = fuzzy_distance(term)
+    return closest_terms(term, conn.execute(*build_vocab_query(term, distance)).fetchall(), distance)
+
+
+def _keystroke(conn, typed):
+    # What one debounced keystroke costs the app: completions plus the page
+    prefix = last_word_prefix(typed)
+    if prefix:
+        conn.execute(*build_suggestion_query(prefix)).fetchall()
+    return _fts_search(conn, incremental_query(typed), "date")
+
+
+def bench_search(db_path, repeat):
+    """LIKE versus FTS latency per query type, on a read-only connection like the app's."""
+    conn = connect_readonly(db_path)
+    results = {}
+    try:
+        for name, (search_query, patterns, combine) in SEARCHES.items():
+            results[name] = {
+                "matches": _fts_search(conn, search_query, "date"),
+                "like_matches": _like_search(conn, patterns, combine),
+                "like": _timings(lambda: _like_search(conn, patterns, combine), repeat),
+                "fts_date": _timings(lambda: _fts_search(conn, search_query, "date"), repeat),
+                "fts_relevance": _timings(lambda: _fts_search(conn, search_query, "relevance"), repeat),
+                "substring_date": _timings(lambda: _fts_search(conn, search_query, "date", "substring"), repeat),
+            }
+        results["browse"] = {
+            "fts_date": _timings(lambda: _fts_search(conn, "", "date"), repeat),
+        }
+        sender, recipient = (row[0] for row in conn.execute("""
+            SELECT person_id FROM letter_people GROUP BY person_id ORDER BY COUNT(*) DESC, person_id LIMIT 2
+        """))
+        results["correspondents"] = {
+            "matches": _correspondent_search(conn, (sender,), (recipient,)),
+            "filtered": _timings(lambda: _correspondent_search(conn, (sender,), (recipient,)), repeat),
+        }
+        # Search-as-you-type, one entry per keystroke of a common and a rare word
+        results["typing"] = {
+            word[:length]: _timings(lambda: _keystroke(conn, word[:length]), repeat)
+            for word in ("garden", "lighthouse") for length in range(2, len(word) + 1, 2)
+        }
+        # Misspellings against the generator's vocabulary
+        results["fuzzy"] = {
+            name: _timings(lambda: _fuzzy_expand(conn, term), repeat)
+            for name, term in (("tomatos", "tomatos"), ("harvst", "harvst"), ("lighthuose", "lighthuose"))
+        }
+        # The sidebar timeline: summary table when browsing, grouped FTS hits when searching
+        results["timeline"] = {
+            name: _timings(lambda: conn.execute(*build_timeline_query(search_query)).fetchall(), repeat)
+            for name, search_query in (("browse", ""), ("common_word", "garden"), ("rare_word", "lighthouse"))
+        }
+    finally:
+        conn.close()
+    return results
+
+
+def bench_cleaning(samples=2000, seed=0):
+    """Throughput of the import-time cleaner and HTML formatter."""
+    rng = random.Random(seed)
+    texts = [letter_text(rng) for _ in range(samples)]
+    total_bytes = sum(len(text.encode()) for text in texts)
+    start = time.perf_counter()
+    for text in texts:
+        format_letter_html(clean_text_content(text))
+    elapsed = time.perf_counter() - start
+    return {
+        "letters": samples,
+        "letters_per_s": round(samples / elapsed, 1),
+        "us_per_letter": round(elapsed / samples * 1e6, 2),
+        "mb_per_s": round(total_bytes / elapsed / 1e6, 2),
+    }
+
+
+def bench_image_decode(workdir, pages=3, repeat=5):
+    """Read and decode cost of a full-size PNG original versus its display derivatives.
+
+    Files are read through the local scan storage backend, so this is the
+    app's image path minus the network.
+    """
+    page_dir = os.path.join(workdir, "pages")
+    derivative_dir = os.path.join(workdir, "page-derivatives")
+    os.makedirs(page_dir, exist_ok=True)
+    storage = LocalStorage(workdir)
+    results = {}
+    for seed in range(pages):
+        path = os.path.join(page_dir, f"1943-01-15 Letter from Harold to Ruth - Page {seed + 1} of {pages}.png")
+        if not os.path.exists(path):
+            make_page_image(seed=seed).save(path)
+        files = {"original": path}
+        for width, _, derivative_path, _ in make_derivatives(path, derivative_dir):
+            files[f"w{width}"] = derivative_path
+        for label, file_path in files.items():
+            blob_path = os.path.relpath(file_path, workdir)
+            data = storage.get_bytes(blob_path)
+
+            def decode():
+                with Image.open(BytesIO(data)) as image:
+                    image.load()
+
+            read_stats = _timings(lambda: bytes(storage.get_bytes(blob_path)), repeat)
+            decode_stats = _timings(decode, repeat)
+            entry = results.setdefault(label, {"bytes": [], "read_ms": [], "decode_ms": []})
+            entry["bytes"].append(len(data))
+            entry["read_ms"].append(read_stats["median_ms"])
+            entry["decode_ms"].append(decode_stats["median_ms"])
+    return {
+        label: {
+            "bytes": round(statistics.mean(entry["bytes"])),
+            "read_median_ms": round(statistics.mean(entry["read_ms"]), 3),
+            "decode_median_ms": round(statistics.mean(entry["decode_ms"]), 3),
+        }
+        for label, entry in results.items()
+    }
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, workdir=None, repeat=20, decode_pages=3):
+    """Run every benchmark and return the results as one JSON-serialisable dict."""
+    workdir = workdir or os.path.join(tempfile.gettempdir(), "family-letters-bench")
+    results = {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "page_size": PAGE_SIZE,
+        "sizes": {},
+    }
+    for letters in sizes:
+        corpus_dir = os.path.join(workdir, f"corpus-{letters}")
+        marker = os.path.join(corpus_dir, ".complete")
+        if not os.path.exists(marker):
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            print(f"Generating {letters} letters in {corpus_dir}")
+            generate_corpus(corpus_dir, letters)
+            open(marker, "w").close()
+        text_dir = os.path.join(corpus_dir, "text", "final")
+        scan_dir = os.path.join(corpus_dir, "originals")
+        db_path = os.path.join(corpus_dir, "letters.db")
+
+        print(f"[{letters}] import")
+        size_results = {"import": bench_import(text_dir, scan_dir, db_path, letters)}
+        print(f"[{letters}] related")
+        size_results["related"] = bench_related(db_path)
+        print(f"[{letters}] search")
+        size_results["search"] = bench_search(db_path, repeat)
+        results["sizes"][str(letters)] = size_results
+
+    print("cleaning")
+    results["cleaning"] = bench_cleaning()
+    if decode_pages:
+        print("image decode")
+        results["image_decode"] = bench_image_decode(workdir, decode_pages)
+    return results
+
+
+def save_results(results, out_dir=RESULTS_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = results["timestamp"].replace(":", "").replace("-", "").split("+")[0]
+    name = f"{stamp}-{results['commit'] or 'nogit'}{'-dirty' if results['dirty'] else ''}.json"
+    path = os.path.join(out_dir, name)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import, search, cleaning and image decode")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="corpus sizes in letters (default: 1000 10000 100000)")
+    parser.add_argument("--workdir", help="where generated corpora are kept between runs")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per search")
+    parser.add_argument("--decode-pages", type=int, default=3,
+                        help="full-size pages for the image decode benchmark, 0 to skip")
+    parser.add_argument("--out", default=RESULTS_DIR, help="directory to write the results JSON to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.workdir, args.repeat, args.decode_pages)
+    print(f"Results written to {save_results(results, args.out)}")
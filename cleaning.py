@@ -0,0 +1,55 @@
+import html
+import re
+
+# Bump whenever clean_text_content() or format_letter_html() changes, so
+# rows cleaned by an older version are re-cleaned on the next run.
+CLEANER_VERSION = 1
+
+
+class _CleanTable(dict):
+    """str.translate() table folding typography to ASCII and blanking other non-ASCII.
+
+    Lookups for characters not listed are computed once and memoized, so the
+    table covers all of Unicode without being built up front.
+    """
+    def __missing__(self, codepoint):
+        value = codepoint if codepoint < 128 else ' '
+        self[codepoint] = value
+        return value
+
+
+_CLEAN_TABLE = _CleanTable({
+    ord('\u201c'): '"', ord('\u201d'): '"', ord('\u201e'): '"',  # curly double quotes
+    ord('\u2018'): "'", ord('\u2019'): "'", ord('\u201a'): "'",  # curly single quotes
+    ord('\u2013'): '-', ord('\u2014'): '-',                      # en and em dashes
+    ord('\u2026'): '...',
+})
+
+
+# One pass over the text: a letter followed by a digit (a common OCR run-on),
+# a run of blank lines, or a run of other whitespace. The letter/digit split
+# looks through the \x02/\x03 search highlight markers (search.MARK_START,
+# MARK_END), so highlighted text is spaced exactly like the stored text.
+_SPACING_RE = re.compile(r'(?:(?<=[a-zA-Z])|(?<=[a-zA-Z]\x03))(?=\x02?\d)|\n\s*\n|[^\S\n]+')
+
+
+def _fix_spacing(match):
+    return '\n\n' if '\n' in match.group() else ' '
+
+
+def clean_text_content(text):
+    """Normalize OCR'd letter text for display.
+
+    Folds typographic quotes and dashes to ASCII, replaces any other
+    non-ASCII character with a space, separates letters from digits that
+    OCR ran together, collapses blank lines into paragraph breaks and
+    squeezes runs of spaces.
+    """
+    text = text.translate(_CLEAN_TABLE)
+    return _SPACING_RE.sub(_fix_spacing, text).strip()
+
+
+def format_letter_html(text):
+    """Render cleaned letter text as escaped HTML paragraphs."""
+    paragraphs = html.escape(text, quote=False).split('\n\n')
+    return ''.join(f'<p>{p}</p>' for p in paragraphs)
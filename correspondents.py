@@ -0,0 +1,123 @@
+import re
+
+# Bump whenever the parsing below changes, so letters parsed by an older
+# version get their correspondents extracted again on the next run.
+CORRESPONDENTS_VERSION = 3
+
+# Names end at a lower-case connective, a dash or a comma: "... to Ruth about
+# the farm", "from Harold in France", "from Harold - censored", "from Harold,
+# Camp Roberts".
+_DESCRIPTION_END = r'(?:\s+(?-i:about|in|on|re|at)\b.*|\s+-\s.*|\s*,.*)?$'
+# "Letter from Harold to Ruth", "Christmas card from Aunt Edna",
+# "Letter 2 from Mother and Father to Harold"
+_DESCRIPTION_RE = re.compile(
+    r'\bfrom\s+(?P<senders>[^,]+?)(?:\s+to\s+(?P<recipients>[^,]+?))?' + _DESCRIPTION_END,
+    re.IGNORECASE,
+)
+# "Letter to Ruth from Harold"
+_TO_FROM_RE = re.compile(
+    r'\bto\s+(?P<recipients>[^,]+?)\s+from\s+(?P<senders>[^,]+?)' + _DESCRIPTION_END,
+    re.IGNORECASE,
+)
+# "Dear Ruth,", "My dearest Mother -", "Hello Harold!"
+_SALUTATION_RE = re.compile(
+    r"^\s*(?:my\s+)?(?:dear(?:est)?|hi|hello)\s+(?P<names>[A-Z][\w.' ]*?(?:\s+(?:and|&)\s+[A-Z][\w.' ]*?)?)\s*[,:!-]",
+    re.IGNORECASE,
+)
+# "Love,", "Your loving son,", "Sincerely yours,", optionally followed by the
+# name on the same line
+_CLOSING_RE = re.compile(
+    r"^\s*(?:(?:with\s+)?(?:all\s+my\s+)?love|your[s]?(?:\s+\w+){0,3}|sincerely(?:\s+yours)?|"
+    r"affectionately|as\s+ever|cheerio|best\s+wishes|regards)\s*[,.!-]\s*(?P<name>[A-Z][\w.' ]*)?\s*$",
+    re.IGNORECASE,
+)
+_SPLIT_RE = re.compile(r'\s*(?:,|&|\band\b)\s*', re.IGNORECASE)
+
+# Salutations and signatures that name nobody in particular
+_NOT_NAMES = {'friend', 'friends', 'all', 'everyone', 'folks', 'sir', 'madam', 'sirs', 'you'}
+_MAX_NAME_WORDS = 4
+# The only lower-case words a name may contain, after its first word
+_NAME_PARTICLES = {'van', 'von', 'de', 'der', 'den', 'da', 'di', 'du', 'la', 'le'}
+
+
+def normalize_name(name):
+    """Tidy one name as written ("  Aunt  Edna." -> "Aunt Edna"), or None if it isn't one.
+
+    Names are capitalized; lower-case words ("the front", "written on
+    train", "give love to Sis") are ordinary text that happened to sit
+    where a name goes.
+    """
+    name = ' '.join(name.strip(" \t.,;:!-'\"").split())
+    words = name.split()
+    if not name or name.lower() in _NOT_NAMES or len(words) > _MAX_NAME_WORDS:
+        return None
+    if not re.fullmatch(r"[A-Za-z][A-Za-z.' ]*", name):
+        return None
+    if not words[0][0].isupper() or any(
+        not word[0].isupper() and word not in _NAME_PARTICLES for word in words[1:]
+    ):
+        return None
+    return name
+
+
+def _names(text):
+    names = []
+    for part in _SPLIT_RE.split(text or ''):
+        name = normalize_name(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def from_description(description):
+    """``(senders, recipients)`` named in a filename description."""
+    match = _TO_FROM_RE.search(description or '') or _DESCRIPTION_RE.search(description or '')
+    if not match:
+        return [], []
+    return _names(match.group('senders')), _names(match.group('recipients'))
+
+
+def from_text(content):
+    """``(senders, recipients)`` from a letter's salutation and signature.
+
+    Only the first few lines are searched for "Dear ...," and only the last
+    few for a closing like "Love," followed by a name.
+    """
+    lines = [line for line in (content or '').splitlines() if line.strip()]
+    recipients = []
+    for line in lines[:3]:
+        match = _SALUTATION_RE.match(line)
+        if match:
+            recipients = _names(match.group('names'))
+            break
+
+    senders = []
+    tail = lines[-4:]
+    for i, line in enumerate(tail):
+        match = _CLOSING_RE.match(line)
+        if not match:
+            continue
+        if match.group('name'):
+            senders = _names(match.group('name'))
+        elif i + 1 < len(tail):
+            senders = _names(tail[i + 1])
+    return senders, recipients
+
+
+def extract_correspondents(description, content):
+    """``(name, role, source)`` for everyone a letter is from or to.
+
+    The filename is typed by whoever archived the letter and wins; the
+    salutation and signature only fill in a role the filename leaves out,
+    as in "Postcard from Harold" opening with "Dear Ruth,".
+    """
+    named_senders, named_recipients = from_description(description)
+    text_senders, text_recipients = from_text(content)
+    rows = []
+    for role, named, found in (('from', named_senders, text_senders),
+                               ('to', named_recipients, text_recipients)):
+        if named:
+            rows.extend((name, role, 'filename') for name in named)
+        else:
+            rows.extend((name, role, 'text') for name in found)
+    return rows
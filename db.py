@@ -0,0 +1,84 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+DB_PATH = os.getenv('LETTERS_DB', 'letters.db')
+
+# The app never writes, so every connection is opened read-only. In the
+# Docker image the database is baked in and cannot change underneath us,
+# which lets SQLite skip file locking entirely (immutable=1).
+DB_IMMUTABLE = os.getenv('LETTERS_DB_IMMUTABLE', '0') == '1'
+POOL_SIZE = int(os.getenv('LETTERS_DB_POOL_SIZE', '4'))
+
+MMAP_SIZE = 256 * 1024 * 1024  # bytes of the database file to memory-map
+CACHE_SIZE = -32 * 1024        # negative means KiB, i.e. 32 MiB page cache per connection
+
+
+def connect_readonly(db_path=DB_PATH, immutable=DB_IMMUTABLE):
+    """Open a read-only connection to the letters database with tuned pragmas."""
+    uri = Path(db_path).resolve().as_uri() + ('?immutable=1' if immutable else '?mode=ro')
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = {CACHE_SIZE}')
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+class ConnectionPool:
+    """A small, thread-safe pool of read-only SQLite connections.
+
+    Connections are created lazily up to ``size`` and handed out exclusively,
+    so one Streamlit session never shares a cursor with another. When every
+    connection is busy, callers wait for one to be returned.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE, immutable=DB_IMMUTABLE):
+        self.db_path = db_path
+        self.size = size
+        self.immutable = immutable
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = connect_readonly(self.db_path, self.immutable)
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        """Close every connection; ones still checked out close on release."""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
@@ -4,10 +4,72 @@ from datetime import datetime
 import re
 from pathlib import Path
 import json
+import hashlib
+import math
+import argparse
+import bisect
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def init_db():
+import numpy as np
+from PIL import Image
+
+from cleaning import CLEANER_VERSION, clean_text_content, format_letter_html
+from correspondents import CORRESPONDENTS_VERSION, extract_correspondents
+from db import DB_PATH
+from related import (
+    RELATED_DIMS, RELATED_FULL_REBUILD_FRACTION, RELATED_TOP_K, load_term_matrix, save_term_matrix, stale_rows,
+    term_vector, tfidf, top_neighbours, vectors_path_for,
+)
+from search import TIMELINE_GRANULARITIES
+
+# Display-size copies of every scan, so the viewer never has to ship the
+# full-resolution original just to show it in a column.
+DERIVATIVE_WIDTHS = (400, 800, 1600)
+DERIVATIVE_FORMAT = os.getenv('SCAN_DERIVATIVE_FORMAT', 'webp')  # or 'jpeg'
+DERIVATIVE_QUALITY = 80
+
+# Deep-zoom (DZI) tile pyramids of every scan, so the zoom viewer only
+# fetches the tiles covering what is on screen.
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+TILE_FORMAT = os.getenv('SCAN_TILE_FORMAT', 'jpeg')  # or 'webp' / 'png'
+TILE_QUALITY = 85
+
+# Imports with fewer changed files than the threshold read them in-process,
+# where starting a process pool would cost more than it saves. Rows are
+# written in executemany() batches of IMPORT_BATCH_SIZE.
+PARALLEL_IMPORT_THRESHOLD = 256
+IMPORT_BATCH_SIZE = 1000
+
+# Columns added to letters after the original schema, as (name, declaration)
+LETTER_COLUMNS = [
+    ('content_html', 'TEXT'),  # cleaned, paragraph-formatted content
+    ('cleaner_version', 'INTEGER'),
+    # Change detection for incremental re-imports
+    ('source_size', 'INTEGER'),
+    ('source_mtime', 'REAL'),
+    ('content_hash', 'TEXT'),
+    # 'day' or 'month': YYYY-MM filenames are stored on the first of the month
+    ('date_precision', 'TEXT'),
+    ('correspondents_version', 'INTEGER'),
+]
+
+# Bump when the schema changes; recorded in archive_meta
+SCHEMA_VERSION = 11
+
+def add_missing_columns(c, table, columns):
+    """Add columns that an existing database created by an older version lacks."""
+    existing = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    for name, declaration in columns:
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declaration}')
+
+def init_db(db_path=DB_PATH):
     # Create database and tables
-    conn = sqlite3.connect('letters.db')
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
     # Create letters table
@@ -22,21 +84,202 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    add_missing_columns(c, 'letters', LETTER_COLUMNS)
     
-    # Create full-text search index
+    # Older versions re-inserted every file on each run; keep the first copy
+    c.execute('''
+        DELETE FROM letters
+        WHERE text_path IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM letters GROUP BY text_path)
+    ''')
+    duplicates_removed = c.rowcount
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_letters_text_path ON letters(text_path)')
+    # Date range filters and newest-first paging become index range scans
+    c.execute('CREATE INDEX IF NOT EXISTS idx_letters_date ON letters(date)')
+    
+    # Backfill date precision for letters imported before it was recorded
+    c.executemany('UPDATE letters SET date_precision = ? WHERE id = ?', [
+        (parse_date_precision(os.path.basename(text_path)), letter_id)
+        for letter_id, text_path in c.execute(
+            'SELECT id, text_path FROM letters WHERE date_precision IS NULL AND text_path IS NOT NULL'
+        ).fetchall()
+    ])
+    
+    # Create full-text search index. Two- and three-letter prefix indexes
+    # keep the prefix queries of search-as-you-type to one doclist lookup;
+    # indexes created before them are rebuilt with them.
+    fts_sql = c.execute("SELECT sql FROM sqlite_master WHERE name = 'letters_fts'").fetchone()
+    fts_outdated = fts_sql is not None and 'prefix' not in fts_sql[0]
+    if fts_outdated:
+        c.execute('DROP TABLE IF EXISTS letters_vocab')
+        c.execute('DROP TABLE letters_fts')
     c.execute('''
         CREATE VIRTUAL TABLE IF NOT EXISTS letters_fts USING fts5(
             content,
             description,
             date,
             content='letters',
-            content_rowid='id'
+            content_rowid='id',
+            prefix='2 3'
+        )
+    ''')
+    # Trigram index of the same text, so substring searches stay indexed;
+    # built from the letters already there when first added
+    trigram_exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'letters_trigram'"
+    ).fetchone()
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS letters_trigram USING fts5(
+            content,
+            description,
+            content='letters',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+    ''')
+    if duplicates_removed or fts_outdated:
+        c.execute("INSERT INTO letters_fts(letters_fts) VALUES('rebuild')")
+    if duplicates_removed or not trigram_exists:
+        c.execute("INSERT INTO letters_trigram(letters_trigram) VALUES('rebuild')")
+    # Every indexed word with the number of letters containing it, for
+    # fuzzy search and search suggestions
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS letters_vocab USING fts5vocab(letters_fts, 'row')")
+    # The same counts copied into a plain table, see update_word_counts():
+    # reading letters_vocab walks every doclist in the range
+    word_counts_exist = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'word_counts'"
+    ).fetchone()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS word_counts (
+            term TEXT PRIMARY KEY,
+            letters INTEGER NOT NULL,
+            length INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    if duplicates_removed or fts_outdated or not word_counts_exist:
+        update_word_counts(c)
+    
+    # Archive-wide facts the app reads once instead of aggregating per rerun,
+    # see update_archive_meta()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archive_meta (
+            key TEXT PRIMARY KEY,
+            value
+        )
+    ''')
+    update_archive_meta(c)
+    
+    # Who wrote each letter to whom, see extract_correspondents(). Filters
+    # look letters up by person and role through the second index.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS people (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS letter_people (
+            letter_id INTEGER NOT NULL,
+            role TEXT NOT NULL,    -- 'from' or 'to'
+            person_id INTEGER NOT NULL,
+            source TEXT NOT NULL,  -- 'filename' or 'text'
+            PRIMARY KEY (letter_id, role, person_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_letter_people_person ON letter_people(person_id, role, letter_id)')
+    
+    # Letters per year and per month for the sidebar timeline, see
+    # update_timeline_counts()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS timeline_counts (
+            granularity TEXT NOT NULL,  -- 'year' or 'month'
+            period TEXT NOT NULL,       -- '1943' or '1943-01'
+            letters INTEGER NOT NULL,
+            PRIMARY KEY (granularity, period)
+        ) WITHOUT ROWID
+    ''')
+    update_timeline_counts(c)
+    
+    # Precomputed most similar letters, see update_related_letters()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS related_letters (
+            letter_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            related_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (letter_id, rank)
+        ) WITHOUT ROWID
+    ''')
+    # Which content each row of the term matrix file was computed from
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS letter_vectors (
+            letter_id INTEGER PRIMARY KEY,
+            content_hash TEXT
+        )
+    ''')
+    
+    # Deep-zoom pyramids of the original scans, see generate_tile_pyramids()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scan_tiles (
+            original_path TEXT PRIMARY KEY,
+            dzi_path TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL
+        )
+    ''')
+    
+    # Resized copies of the original scans, see generate_derivatives()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS scan_derivatives (
+            original_path TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            PRIMARY KEY (original_path, width)
         )
     ''')
     
     conn.commit()
     conn.close()
 
+def update_archive_meta(c):
+    """Record date bounds, letter count and schema version in archive_meta."""
+    min_date, max_date, letter_count = c.execute(
+        'SELECT MIN(date), MAX(date), COUNT(*) FROM letters'
+    ).fetchone()
+    c.executemany('INSERT OR REPLACE INTO archive_meta (key, value) VALUES (?, ?)', [
+        ('min_date', min_date),
+        ('max_date', max_date),
+        ('letter_count', letter_count),
+        ('schema_version', SCHEMA_VERSION),
+    ])
+
+def update_timeline_counts(c):
+    """Recount letters per year and month, in two scans of the date index."""
+    c.execute('DELETE FROM timeline_counts')
+    for granularity, length in TIMELINE_GRANULARITIES.items():
+        c.execute(f'''
+            INSERT INTO timeline_counts (granularity, period, letters)
+            SELECT ?, substr(date, 1, {length}) AS period, COUNT(*)
+            FROM letters GROUP BY period
+        ''', (granularity,))
+
+def update_word_counts(c):
+    """Copy every indexed word and its letter count out of letters_vocab, in one pass."""
+    c.execute('DELETE FROM word_counts')
+    c.execute('''
+        INSERT INTO word_counts (term, letters, length)
+        SELECT term, doc, length(term) FROM letters_vocab
+    ''')
+
+def bump_import_generation(c):
+    """Count one more change to the letters; the app drops cached query results."""
+    c.execute('''
+        INSERT INTO archive_meta (key, value) VALUES ('import_generation', 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1
+    ''')
+
 def get_base_filename(filename):
     """Extract the base part of the filename without page numbers and extension."""
     # Remove page numbers like "- Page 1 of 2" or "- Pg 1 of 2"
@@ -45,15 +288,28 @@ def get_base_filename(filename):
     base = os.path.splitext(base)[0]
     return base
 
-def find_matching_images(base_name, scan_dir):
-    """Find all image files that match the base name of the text file."""
-    matching_images = []
-    for image_file in os.listdir(scan_dir):
-        if image_file.lower().endswith('.png'):
-            image_base = get_base_filename(image_file)
-            if image_base.startswith(base_name):
-                matching_images.append(os.path.join(scan_dir, image_file))
-    return sorted(matching_images)  # Sort to maintain page order
+class ScanIndex:
+    """Base name -> page images for a scan directory, built with one listdir().
+    
+    Text files match every image whose base name starts with the text's
+    base name; keeping the base names sorted turns that prefix match into
+    a binary search instead of a pass over the whole directory.
+    """
+    def __init__(self, scan_dir):
+        self.pages = {}
+        for image_file in os.listdir(scan_dir):
+            if image_file.lower().endswith('.png'):
+                image_base = get_base_filename(image_file)
+                self.pages.setdefault(image_base, []).append(os.path.join(scan_dir, image_file))
+        self.bases = sorted(self.pages)
+    
+    def find(self, base_name):
+        start = bisect.bisect_left(self.bases, base_name)
+        end = bisect.bisect_left(self.bases, base_name + '\U0010ffff', start)
+        matching_images = []
+        for image_base in self.bases[start:end]:
+            matching_images.extend(self.pages[image_base])
+        return sorted(matching_images)  # Sort to maintain page order
 
 def parse_date(filename):
     """Extract date from filename, handling both YYYY-MM-DD and YYYY-MM formats."""
@@ -66,6 +322,13 @@ def parse_date(filename):
         date_str += "-01"  # Default to first day of month
     return date_str
 
+def parse_date_precision(filename):
+    """How much of the date parse_date() found was in the filename: 'day' or 'month'."""
+    date_match = re.match(r'^\d{4}-\d{2}(-\d{2})?', filename)
+    if not date_match:
+        return None
+    return 'day' if date_match.group(1) else 'month'
+
 def extract_description(filename):
     """Extract description from filename, cleaning up common patterns."""
     # Remove date pattern from start
@@ -76,73 +339,587 @@ def extract_description(filename):
     desc = re.sub(r'\s*-\s*(?:Page|Pg)\s*\d+\s*of\s*\d+.*$', '', desc)
     return desc.strip()
 
-def import_letters(text_dir, scan_dir):
-    conn = sqlite3.connect('letters.db')
+def refresh_cleaned_content(db_path=DB_PATH):
+    """Re-clean letters whose content_html is missing or from an older cleaner."""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    rows = c.execute(
+        'SELECT id, content FROM letters WHERE cleaner_version IS NULL OR cleaner_version != ?',
+        (CLEANER_VERSION,)
+    ).fetchall()
+    c.executemany(
+        'UPDATE letters SET content_html = ?, cleaner_version = ? WHERE id = ?',
+        [(format_letter_html(clean_text_content(content)), CLEANER_VERSION, letter_id)
+         for letter_id, content in rows]
+    )
+    if rows:
+        bump_import_generation(c)
+    conn.commit()
+    conn.close()
+    if rows:
+        print(f"Re-cleaned {len(rows)} letters with cleaner version {CLEANER_VERSION}")
+
+def _write_correspondents(c, letters):
+    """Replace the letter_people rows of (letter_id, extract_correspondents() rows) pairs."""
+    c.executemany('DELETE FROM letter_people WHERE letter_id = ?', [(letter_id,) for letter_id, _ in letters])
+    c.executemany('INSERT OR IGNORE INTO people (name) VALUES (?)', [
+        (name,) for _, correspondents in letters for name, _, _ in correspondents
+    ])
+    c.executemany('''
+        INSERT OR IGNORE INTO letter_people (letter_id, role, person_id, source)
+        SELECT ?, ?, id, ? FROM people WHERE name = ?
+    ''', [
+        (letter_id, role, source, name)
+        for letter_id, correspondents in letters for name, role, source in correspondents
+    ])
+
+def _prune_people(c):
+    c.execute('DELETE FROM people WHERE id NOT IN (SELECT person_id FROM letter_people)')
+
+def refresh_correspondents(db_path=DB_PATH):
+    """Extract correspondents of letters never parsed, or parsed by an older version."""
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
+    rows = c.execute(
+        '''SELECT id, description, content FROM letters
+           WHERE correspondents_version IS NULL OR correspondents_version != ?''',
+        (CORRESPONDENTS_VERSION,)
+    ).fetchall()
+    _write_correspondents(c, [
+        (letter_id, extract_correspondents(description, content))
+        for letter_id, description, content in rows
+    ])
+    c.executemany('UPDATE letters SET correspondents_version = ? WHERE id = ?',
+                  [(CORRESPONDENTS_VERSION, letter_id) for letter_id, _, _ in rows])
+    if rows:
+        _prune_people(c)
+        bump_import_generation(c)
+    conn.commit()
+    conn.close()
+    if rows:
+        print(f"Extracted correspondents of {len(rows)} letters with version {CORRESPONDENTS_VERSION}")
+
+def _delete_from_fts(c, letter_ids):
+    """Remove letters from the external-content FTS indexes using their stored values."""
+    params = [(letter_id,) for letter_id in letter_ids]
+    c.executemany('''
+        INSERT INTO letters_fts(letters_fts, rowid, content, description, date)
+        SELECT 'delete', id, content, description, date FROM letters WHERE id = ?
+    ''', params)
+    c.executemany('''
+        INSERT INTO letters_trigram(letters_trigram, rowid, content, description)
+        SELECT 'delete', id, content, description FROM letters WHERE id = ?
+    ''', params)
+
+def _read_letter(text_path):
+    """Read, hash and clean one text file; runs in the import worker processes."""
+    try:
+        with open(text_path, 'rb') as f:
+            raw = f.read()
+        content = raw.decode('utf-8')
+        # Clean once here so the viewer only has to emit the HTML
+        content_html = format_letter_html(clean_text_content(content))
+        return hashlib.sha256(raw).hexdigest(), content, content_html, None
+    except Exception as e:
+        return None, None, None, str(e)
+
+def _write_batch(c, inserts, updates, touches, fts_rows, correspondents):
+    if touches:
+        c.executemany('UPDATE letters SET source_size = ?, source_mtime = ? WHERE id = ?', touches)
+    if updates:
+        _delete_from_fts(c, [row[-1] for row in updates])
+        c.executemany('''
+            UPDATE letters
+            SET date = ?, description = ?, content = ?, scan_paths = ?, content_html = ?,
+                cleaner_version = ?, source_size = ?, source_mtime = ?, content_hash = ?,
+                date_precision = ?, correspondents_version = ?
+            WHERE id = ?
+        ''', updates)
+    if inserts:
+        c.executemany('''
+            INSERT INTO letters (date, description, content, scan_paths, content_html,
+                                 cleaner_version, source_size, source_mtime, content_hash,
+                                 date_precision, correspondents_version, text_path, id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', inserts)
+    if fts_rows:
+        c.executemany('''
+            INSERT INTO letters_fts(rowid, content, description, date)
+            VALUES (?, ?, ?, ?)
+        ''', fts_rows)
+        c.executemany('''
+            INSERT INTO letters_trigram(rowid, content, description)
+            VALUES (?, ?, ?)
+        ''', [row[:3] for row in fts_rows])
+    if correspondents:
+        _write_correspondents(c, correspondents)
+    for batch in (inserts, updates, touches, fts_rows, correspondents):
+        batch.clear()
+
+def import_letters(text_dir, scan_dir, db_path=DB_PATH, max_workers=None):
+    """Bring the database in line with the text files in text_dir.
     
-    imported_count = 0
-    error_count = 0
+    Each letter is tracked by its source path, size, mtime and content hash:
+    new files are inserted, changed ones updated, and letters whose file is
+    gone are removed, all in one transaction with matching FTS updates.
+    Unchanged files are skipped without being read, so re-running is cheap
+    and never duplicates rows.
+    
+    The scan directory is indexed once up front, changed files are read and
+    cleaned in a process pool, and rows are written with batched
+    executemany(). Returns a dict of counts.
+    """
+    start_time = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    # The database can always be rebuilt from dataset/, so trade crash
+    # safety for import speed
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')  # 256 MiB
+    c = conn.cursor()
+    
+    existing = {
+        row[0]: row[1:] for row in c.execute('''
+            SELECT text_path, id, source_size, source_mtime, content_hash, scan_paths
+            FROM letters WHERE text_path IS NOT NULL
+        ''')
+    }
+    next_id = (c.execute('SELECT MAX(id) FROM letters').fetchone()[0] or 0) + 1
+    scan_index = ScanIndex(scan_dir)
+    seen = set()
+    counts = {'imported': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'errors': 0}
     
-    for filename in os.listdir(text_dir):
+    # Decide cheaply, from the filename and stat() alone, which files need reading
+    pending = []
+    for filename in sorted(os.listdir(text_dir)):
         if not filename.endswith('.txt'):
             continue
-            
+        
+        text_path = os.path.join(text_dir, filename)
+        seen.add(text_path)
         try:
             # Parse date
             letter_date = parse_date(filename)
             if not letter_date:
                 print(f"Warning: Could not parse date from {filename}")
-                error_count += 1
+                counts['errors'] += 1
                 continue
             
-            # Get description
-            description = extract_description(filename)
-            
-            # Find matching image files
-            base_name = get_base_filename(filename)
-            matching_images = find_matching_images(base_name, scan_dir)
-            
-            # Read letter content
-            with open(os.path.join(text_dir, filename), 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Store image paths as proper JSON
+            # Find matching image files, stored as proper JSON
+            matching_images = scan_index.find(get_base_filename(filename))
             scan_paths = json.dumps(matching_images) if matching_images else None
             
-            # Insert into database
-            c.execute('''
-                INSERT INTO letters (date, description, content, scan_paths, text_path)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (letter_date, description, content, scan_paths, os.path.join(text_dir, filename)))
+            stat = os.stat(text_path)
+            old = existing.get(text_path)
+            if (old is not None and scan_paths == old[4]
+                    and (stat.st_size, stat.st_mtime) == (old[1], old[2])):
+                counts['unchanged'] += 1
+                continue
+            pending.append((filename, text_path, letter_date, scan_paths, stat, old))
+        except Exception as e:
+            print(f"Error importing {filename}: {str(e)}")
+            counts['errors'] += 1
+    
+    inserts, updates, touches, fts_rows, correspondents = [], [], [], [], []
+    text_paths = [item[1] for item in pending]
+    if len(pending) >= PARALLEL_IMPORT_THRESHOLD:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(_read_letter, text_paths, chunksize=64)
+    else:
+        executor = None
+        results = map(_read_letter, text_paths)
+    try:
+        for (filename, text_path, letter_date, scan_paths, stat, old), result in zip(pending, results):
+            content_hash, content, content_html, error = result
+            if error:
+                print(f"Error importing {filename}: {error}")
+                counts['errors'] += 1
+                continue
             
-            # Update FTS index
-            c.execute('''
-                INSERT INTO letters_fts(rowid, content, description, date)
-                VALUES (last_insert_rowid(), ?, ?, ?)
-            ''', (content, description, letter_date))
+            if old is not None and content_hash == old[3] and scan_paths == old[4]:
+                # Touched but not changed: just remember the new size and mtime
+                touches.append((stat.st_size, stat.st_mtime, old[0]))
+                counts['unchanged'] += 1
+                continue
             
-            imported_count += 1
-            print(f"Imported: {filename}")
+            # Get description
+            description = extract_description(filename)
+            values = (letter_date, description, content, scan_paths, content_html, CLEANER_VERSION,
+                      stat.st_size, stat.st_mtime, content_hash, parse_date_precision(filename),
+                      CORRESPONDENTS_VERSION)
+            if old is None:
+                letter_id = next_id
+                next_id += 1
+                inserts.append(values + (text_path, letter_id))
+                counts['imported'] += 1
+                print(f"Imported: {filename}")
+            else:
+                letter_id = old[0]
+                updates.append(values + (letter_id,))
+                counts['updated'] += 1
+                print(f"Updated: {filename}")
+            fts_rows.append((letter_id, content, description, letter_date))
+            correspondents.append((letter_id, extract_correspondents(description, content)))
             
-        except Exception as e:
-            print(f"Error importing {filename}: {str(e)}")
-            error_count += 1
+            if len(fts_rows) >= IMPORT_BATCH_SIZE:
+                _write_batch(c, inserts, updates, touches, fts_rows, correspondents)
+        _write_batch(c, inserts, updates, touches, fts_rows, correspondents)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    # Drop letters whose text file has been deleted from this directory
+    text_dir_path = os.path.dirname(os.path.join(text_dir, 'letter.txt'))
+    for text_path, (letter_id, *_) in existing.items():
+        if text_path not in seen and os.path.dirname(text_path) == text_dir_path:
+            _delete_from_fts(c, [letter_id])
+            c.execute('DELETE FROM letter_people WHERE letter_id = ?', (letter_id,))
+            c.execute('DELETE FROM letters WHERE id = ?', (letter_id,))
+            counts['removed'] += 1
+            print(f"Removed: {os.path.basename(text_path)}")
     
+    update_archive_meta(c)
+    if counts['imported'] or counts['updated'] or counts['removed']:
+        _prune_people(c)
+        update_timeline_counts(c)
+        update_word_counts(c)
+        bump_import_generation(c)
     conn.commit()
     conn.close()
     
+    elapsed = time.perf_counter() - start_time
     print(f"\nImport completed:")
-    print(f"Successfully imported: {imported_count} letters")
+    print(f"Successfully imported: {counts['imported']} letters")
+    print(f"Updated: {counts['updated']}, unchanged: {counts['unchanged']}, removed: {counts['removed']}")
+    print(f"Errors: {counts['errors']}")
+    print(f"Scanned {len(seen)} files in {elapsed:.2f} seconds ({len(seen) / max(elapsed, 1e-9):.0f} files/sec)")
+    return counts
+
+def watch_letters(text_dir, scan_dir, derivatives_dir, db_path=DB_PATH, settle_seconds=2.0,
+                  tiles_dir=None):
+    """Re-run the import whenever files under text_dir or scan_dir change.
+    
+    Events are coalesced until the directories have been quiet for
+    settle_seconds, so copying in a batch of files triggers one import.
+    Runs until interrupted.
+    """
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    
+    changed = threading.Event()
+    scans_changed = threading.Event()
+    
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory:
+                return
+            paths = [event.src_path, getattr(event, 'dest_path', '')]
+            if any(p.endswith('.txt') for p in paths):
+                changed.set()
+            if any(p.lower().endswith('.png') for p in paths):
+                changed.set()
+                scans_changed.set()
+    
+    observer = Observer()
+    observer.schedule(Handler(), text_dir)
+    observer.schedule(Handler(), scan_dir)
+    observer.start()
+    print(f"Watching {text_dir} and {scan_dir} for changes (Ctrl+C to stop)")
+    try:
+        while True:
+            changed.wait()
+            # Wait for the burst of events to settle
+            changed.clear()
+            while changed.wait(settle_seconds):
+                changed.clear()
+            import_letters(text_dir, scan_dir, db_path)
+            refresh_cleaned_content(db_path)
+            refresh_correspondents(db_path)
+            update_related_letters(db_path)
+            if scans_changed.is_set():
+                scans_changed.clear()
+                generate_derivatives(scan_dir, derivatives_dir, db_path)
+                if tiles_dir:
+                    generate_tile_pyramids(scan_dir, tiles_dir, db_path)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+
+def make_derivatives(original_path, out_dir, widths=DERIVATIVE_WIDTHS, fmt=DERIVATIVE_FORMAT):
+    """Write downscaled copies of one scan, one per width narrower than the original.
+    
+    Derivatives newer than the original are reused rather than re-encoded,
+    and when all of them are, the scan is never decoded: its size comes
+    from the header. Returns a list of (width, height, path, bytes) tuples.
+    """
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    name = os.path.splitext(os.path.basename(original_path))[0]
+    source_mtime = os.path.getmtime(original_path)
+    derivatives = []
+    with Image.open(original_path) as image:
+        original_width, original_height = image.size
+        converted = None
+        for width in widths:
+            if width >= original_width:
+                break
+            height = round(original_height * width / original_width)
+            path = os.path.join(out_dir, f"w{width}", f"{name}.{ext}")
+            if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                if converted is None:
+                    converted = image if image.mode in ('RGB', 'L') else image.convert('RGB')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                resized = converted.resize((width, height), Image.LANCZOS)
+                resized.save(path, fmt.upper(), quality=DERIVATIVE_QUALITY)
+            derivatives.append((width, height, path, os.path.getsize(path)))
+    return derivatives
+
+def _make_derivatives_job(args):
+    original_path, out_dir, widths, fmt = args
+    try:
+        return original_path, make_derivatives(original_path, out_dir, widths, fmt), None
+    except Exception as e:
+        return original_path, [], str(e)
+
+def generate_derivatives(scan_dir, out_dir, db_path=DB_PATH, widths=DERIVATIVE_WIDTHS,
+                         fmt=DERIVATIVE_FORMAT, max_workers=None):
+    """Create display-size derivatives for every scan in parallel and record them."""
+    originals = sorted(
+        os.path.join(scan_dir, f) for f in os.listdir(scan_dir) if f.lower().endswith('.png')
+    )
+    jobs = [(path, out_dir, widths, fmt) for path in originals]
+    
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    error_count = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for original_path, derivatives, error in executor.map(_make_derivatives_job, jobs, chunksize=8):
+            if error:
+                print(f"Error creating derivatives for {original_path}: {error}")
+                error_count += 1
+                continue
+            c.execute('DELETE FROM scan_derivatives WHERE original_path = ?', (original_path,))
+            c.executemany('''
+                INSERT INTO scan_derivatives (original_path, width, height, path, bytes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(original_path, *d) for d in derivatives])
+    
+    # Forget derivatives of scans that are gone
+    c.execute('CREATE TEMP TABLE current_originals (path TEXT PRIMARY KEY)')
+    c.executemany('INSERT INTO current_originals VALUES (?)', [(p,) for p in originals])
+    c.execute('''
+        DELETE FROM scan_derivatives
+        WHERE original_path NOT IN (SELECT path FROM current_originals)
+    ''')
+    conn.commit()
+    conn.close()
+    
+    print(f"\nDerivatives completed:")
+    print(f"Processed: {len(originals) - error_count} scans")
+    print(f"Errors: {error_count}")
+
+def update_related_letters(db_path=DB_PATH, vectors_path=None, top_k=RELATED_TOP_K, full=False):
+    """Bring the term matrix file and the related_letters table up to date.
+    
+    Letters whose content hash is unchanged keep their row of the term
+    matrix; only new and changed letters are vectorised. Neighbour lists
+    are recomputed just for the rows stale_rows() picks, until enough has
+    changed since the last full rebuild that every list is rescored with
+    fresh IDF weights. Returns a dict of counts.
+    """
+    start_time = time.perf_counter()
+    vectors_path = vectors_path or vectors_path_for(db_path)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    
+    letters = c.execute('SELECT id, content_hash FROM letters ORDER BY id').fetchall()
+    ids = np.array([letter_id for letter_id, _ in letters], dtype=np.int64)
+    previous = dict(c.execute('SELECT letter_id, content_hash FROM letter_vectors'))
+    # Matrix rows are in letter id order
+    old_matrix = load_term_matrix(vectors_path)
+    if old_matrix is None or len(old_matrix) != len(previous):
+        full = True
+    old_rows = {letter_id: row for row, letter_id in enumerate(sorted(previous))}
+    
+    # Copy the vectors of unchanged letters, vectorise the rest
+    matrix = np.zeros((len(ids), RELATED_DIMS), dtype=np.float32)
+    changed = []
+    for row, (letter_id, content_hash) in enumerate(letters):
+        if not full and letter_id in previous and previous[letter_id] == content_hash:
+            matrix[row] = old_matrix[old_rows[letter_id]]
+        else:
+            changed.append(row)
+    for row in changed:
+        content, = c.execute('SELECT content FROM letters WHERE id = ?', (int(ids[row]),)).fetchone()
+        matrix[row] = term_vector(content or '')
+    removed = set(previous) - set(ids.tolist())
+    vectors = tfidf(matrix)
+    
+    # Stored scores drift from the current IDF weights as letters change
+    row = c.execute("SELECT value FROM archive_meta WHERE key = 'related_changed_since_full'").fetchone()
+    changed_since_full = (row[0] if row else 0) + len(changed) + len(removed)
+    if changed_since_full > RELATED_FULL_REBUILD_FRACTION * len(ids):
+        full = True
+    if full:
+        stale = np.arange(len(ids))
+    else:
+        stored = {}
+        for letter_id, related_id, score in c.execute(
+            'SELECT letter_id, related_id, score FROM related_letters ORDER BY letter_id, rank'
+        ):
+            stored.setdefault(letter_id, []).append((related_id, score))
+        stale = stale_rows(vectors, ids, changed, removed, stored, top_k)
+    
+    # Replace the stale neighbour lists and those of removed letters
+    c.executemany('DELETE FROM related_letters WHERE letter_id = ?',
+                  [(int(ids[row]),) for row in stale] + [(letter_id,) for letter_id in removed])
+    c.executemany(
+        'INSERT INTO related_letters (letter_id, rank, related_id, score) VALUES (?, ?, ?, ?)',
+        ((int(ids[row]), rank, int(ids[neighbour]), float(score))
+         for row, neighbours, scores in top_neighbours(vectors, stale, top_k)
+         for rank, (neighbour, score) in enumerate(zip(neighbours, scores)))
+    )
+    c.execute('DELETE FROM letter_vectors')
+    c.executemany('INSERT INTO letter_vectors (letter_id, content_hash) VALUES (?, ?)', letters)
+    c.execute("INSERT OR REPLACE INTO archive_meta (key, value) VALUES ('related_changed_since_full', ?)",
+              (0 if full else changed_since_full,))
+    if len(stale) or removed:
+        bump_import_generation(c)
+    # Saved before the commit: if the commit fails, the next run finds
+    # letter_vectors out of step with the matrix and rebuilds everything
+    save_term_matrix(vectors_path, matrix)
+    conn.commit()
+    conn.close()
+    
+    elapsed = time.perf_counter() - start_time
+    print(f"\nRelated letters {'rebuilt' if full else 'updated'}:")
+    print(f"Vectorised {len(changed)} of {len(ids)} letters, rescored {len(stale)} in {elapsed:.2f} seconds")
+    return {'letters': len(ids), 'vectorised': len(changed), 'removed': len(removed),
+            'rescored': len(stale), 'full': full}
+
+def _read_dzi_size(dzi_path):
+    with open(dzi_path) as f:
+        match = re.search(r'<Size Width="(\d+)" Height="(\d+)"', f.read())
+    return int(match.group(1)), int(match.group(2))
+
+def make_tile_pyramid(original_path, out_dir, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, fmt=TILE_FORMAT):
+    """Cut one scan into a Deep Zoom pyramid: <name>.dzi plus <name>_files/<level>/<col>_<row>.<ext>.
+    
+    Level N is the full image and each level below halves it, down to a
+    single pixel at level 0. The .dzi descriptor is written last, so a
+    pyramid whose descriptor is newer than the original is complete and is
+    reused without decoding the scan. Returns (dzi_path, width, height).
+    """
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    name = os.path.splitext(os.path.basename(original_path))[0]
+    dzi_path = os.path.join(out_dir, f"{name}.dzi")
+    if os.path.exists(dzi_path) and os.path.getmtime(dzi_path) >= os.path.getmtime(original_path):
+        return (dzi_path, *_read_dzi_size(dzi_path))
+    
+    tiles_dir = os.path.join(out_dir, f"{name}_files")
+    if os.path.exists(tiles_dir):
+        shutil.rmtree(tiles_dir)  # the scan changed, and perhaps its size with it
+    with Image.open(original_path) as image:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        width, height = image.size
+        level_image = image
+        max_level = math.ceil(math.log2(max(width, height)))
+        for level in range(max_level, -1, -1):
+            level_dir = os.path.join(tiles_dir, str(level))
+            os.makedirs(level_dir)
+            level_width, level_height = level_image.size
+            for col in range(-(-level_width // tile_size)):
+                for row in range(-(-level_height // tile_size)):
+                    # Neighbouring tiles overlap so the viewer can blend seams
+                    left = max(0, col * tile_size - overlap)
+                    top = max(0, row * tile_size - overlap)
+                    right = min(level_width, (col + 1) * tile_size + overlap)
+                    bottom = min(level_height, (row + 1) * tile_size + overlap)
+                    tile = level_image.crop((left, top, right, bottom))
+                    tile.save(os.path.join(level_dir, f"{col}_{row}.{ext}"), fmt.upper(), quality=TILE_QUALITY)
+            level_image = level_image.resize(
+                (max(1, -(-level_width // 2)), max(1, -(-level_height // 2))), Image.LANCZOS
+            )
+    
+    with open(dzi_path, 'w') as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{ext}" '
+            f'Overlap="{overlap}" TileSize="{tile_size}">'
+            f'<Size Width="{width}" Height="{height}"/></Image>\n'
+        )
+    return dzi_path, width, height
+
+def _make_tile_pyramid_job(args):
+    original_path, out_dir = args
+    try:
+        return original_path, make_tile_pyramid(original_path, out_dir), None
+    except Exception as e:
+        return original_path, None, str(e)
+
+def generate_tile_pyramids(scan_dir, out_dir, db_path=DB_PATH, max_workers=None):
+    """Create deep-zoom pyramids for every scan in parallel, skipping unchanged ones, and record them."""
+    originals = sorted(
+        os.path.join(scan_dir, f) for f in os.listdir(scan_dir) if f.lower().endswith('.png')
+    )
+    jobs = [(path, out_dir) for path in originals]
+    
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    error_count = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # One pyramid is a lot of work already, so no chunking
+        for original_path, pyramid, error in executor.map(_make_tile_pyramid_job, jobs):
+            if error:
+                print(f"Error creating tile pyramid for {original_path}: {error}")
+                error_count += 1
+                continue
+            c.execute('''
+                INSERT OR REPLACE INTO scan_tiles (original_path, dzi_path, width, height)
+                VALUES (?, ?, ?, ?)
+            ''', (original_path, *pyramid))
+    
+    # Forget pyramids of scans that are gone
+    c.execute('CREATE TEMP TABLE current_originals (path TEXT PRIMARY KEY)')
+    c.executemany('INSERT INTO current_originals VALUES (?)', [(p,) for p in originals])
+    c.execute('''
+        DELETE FROM scan_tiles
+        WHERE original_path NOT IN (SELECT path FROM current_originals)
+    ''')
+    conn.commit()
+    conn.close()
+    
+    print(f"\nTile pyramids completed:")
+    print(f"Processed: {len(originals) - error_count} scans")
     print(f"Errors: {error_count}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import letters and scans into the letters database")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and re-import whenever files in dataset/ change")
+    args = parser.parse_args()
+    
     init_db()
     # Default paths based on repository structure
     text_dir = os.path.join(os.path.dirname(__file__), "dataset/text/final")
     scan_dir = os.path.join(os.path.dirname(__file__), "dataset/originals")
+    derivatives_dir = os.path.join(os.path.dirname(__file__), "dataset/derivatives")
+    tiles_dir = os.path.join(os.path.dirname(__file__), "dataset/tiles")
     
     if os.path.exists(text_dir) and os.path.exists(scan_dir):
         print(f"Importing letters from {text_dir}")
         import_letters(text_dir, scan_dir)
+        refresh_cleaned_content()
+        refresh_correspondents()
+        update_related_letters()
+        print(f"Creating scan derivatives in {derivatives_dir}")
+        generate_derivatives(scan_dir, derivatives_dir)
+        print(f"Creating deep-zoom tile pyramids in {tiles_dir}")
+        generate_tile_pyramids(scan_dir, tiles_dir)
+        if args.watch:
+            watch_letters(text_dir, scan_dir, derivatives_dir, tiles_dir=tiles_dir)
     else:
         print("Please specify valid paths to text and scan directories")
@@ -0,0 +1,143 @@
+"""Import-time "related letters" index.
+
+Every letter's content is turned into a hashed TF-IDF vector: words are
+hashed into ``RELATED_DIMS`` signed buckets (no vocabulary to store or
+keep in sync), term counts are damped with ``1 + log(count)`` and weighted
+by inverse document frequency per bucket. The raw term vectors are kept as
+one float32 matrix file next to the database, so a re-import only has to
+vectorise the letters that changed.
+
+The ``RELATED_TOP_K`` most similar letters by cosine similarity are
+precomputed with batched matrix products and stored in the
+``related_letters`` table, so the viewer reads them with one primary-key
+lookup.
+"""
+import math
+import os
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from db import DB_PATH
+
+RELATED_DIMS = 512
+RELATED_TOP_K = 5
+# Rows of the similarity matrix computed per matrix product; bounds memory
+# at RELATED_BATCH_SIZE x letters float32 scores
+RELATED_BATCH_SIZE = 256
+# Incremental rebuilds reuse neighbour lists scored with the previous IDF
+# weights. Once more than this fraction of letters changed since the last
+# full rebuild, everything is rescored.
+RELATED_FULL_REBUILD_FRACTION = 0.1
+
+# Words too common in letters to say anything about what one is about
+STOPWORDS = frozenset("""
+    the and for that was with have are but you your all this not his her she him they them their
+    there here from had has were will would could should been being what when which who one our
+    out about just very some any can may also into than then its it's dear love letter write
+    wrote today week well good hope much more now got get how yes
+""".split())
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def vectors_path_for(db_path=DB_PATH):
+    """Where the term matrix of ``db_path`` is kept: ``letters.db`` -> ``letters.vectors.npy``."""
+    return os.path.splitext(str(db_path))[0] + '.vectors.npy'
+
+
+def tokenize(text):
+    """Lower-cased words of three letters or more, stopwords and OCR digits dropped."""
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+def term_vector(text, dims=RELATED_DIMS):
+    """Signed, hashed and sublinearly damped term counts of one text, as float32.
+
+    crc32 rather than hash(), whose value changes between processes.
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    for word, count in Counter(tokenize(text)).items():
+        h = zlib.crc32(word.encode())
+        # The sign bit keeps colliding words from only ever adding up
+        vector[h % dims] += (1.0 + math.log(count)) * (1 if h & 0x80000000 else -1)
+    return vector
+
+
+def tfidf(term_matrix):
+    """IDF-weighted, L2-normalised copy of a term matrix, so dot products are cosines."""
+    doc_freq = np.count_nonzero(term_matrix, axis=0)
+    idf = np.log((1 + len(term_matrix)) / (1 + doc_freq)).astype(np.float32) + 1
+    weighted = term_matrix * idf
+    norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+    return weighted / np.maximum(norms, 1e-12)
+
+
+def top_neighbours(vectors, rows, top_k=RELATED_TOP_K, batch_size=RELATED_BATCH_SIZE):
+    """The ``top_k`` most similar other rows for each of ``rows``, best first.
+
+    Yields ``(row, neighbour_rows, scores)``. Letters with no words in
+    common score 0 and are left out.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    k = min(top_k, len(vectors) - 1)
+    if k <= 0:
+        for row in rows:
+            yield int(row), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        scores = vectors[batch] @ vectors.T
+        scores[np.arange(len(batch)), batch] = -np.inf  # never related to itself
+        best = np.argpartition(scores, -k, axis=1)[:, -k:]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row, neighbours, neighbour_scores in zip(batch, best, best_scores):
+            keep = neighbour_scores > 0
+            yield int(row), neighbours[keep], neighbour_scores[keep]
+
+
+def stale_rows(vectors, ids, changed_rows, removed_ids, stored, top_k=RELATED_TOP_K,
+               batch_size=RELATED_BATCH_SIZE):
+    """Rows whose stored neighbour list an incremental rebuild has to recompute.
+
+    ``stored`` maps letter ids to their current ``[(related_id, score), ...]``
+    best first. A list is stale if its letter changed, if it names a letter
+    that changed or went away, or if a changed letter now beats its weakest
+    entry.
+    """
+    stale = set(changed_rows)
+    changed_ids = set(ids[list(changed_rows)].tolist()) | set(removed_ids)
+    for row, letter_id in enumerate(ids.tolist()):
+        if any(related_id in changed_ids for related_id, _ in stored.get(letter_id, ())):
+            stale.add(row)
+    if changed_rows:
+        changed_vectors = vectors[list(changed_rows)]
+        for start in range(0, len(ids), batch_size):
+            best = (vectors[start:start + batch_size] @ changed_vectors.T).max(axis=1)
+            for offset, letter_id in enumerate(ids[start:start + batch_size].tolist()):
+                neighbours = stored.get(letter_id, ())
+                weakest = neighbours[-1][1] if len(neighbours) >= top_k else 0.0
+                if best[offset] > weakest:
+                    stale.add(start + offset)
+    return np.array(sorted(stale), dtype=np.int64)
+
+
+def load_term_matrix(vectors_path, dims=RELATED_DIMS):
+    """The saved term matrix, or None if it is missing or was built with other settings."""
+    try:
+        matrix = np.load(vectors_path)
+    except (FileNotFoundError, ValueError):
+        return None
+    return matrix if matrix.ndim == 2 and matrix.shape[1] == dims else None
+
+
+def save_term_matrix(vectors_path, matrix):
+    # Write then rename, so a crash never leaves a truncated matrix behind
+    tmp_path = vectors_path + '.tmp.npy'
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, vectors_path)
@@ -0,0 +1,122 @@
+import hashlib
+import hmac
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+# 'proxy' sends scan bytes through the app process to the browser; 'url'
+# hands the browser a time-limited direct URL (GCS signed URL, or this
+# module's file server for local storage) and the app never touches them.
+SCAN_DELIVERY = os.getenv('SCAN_DELIVERY', 'proxy')
+
+# Direct URLs stay valid for between one and two of these windows. They
+# are reused within a window, so browsers can cache the images.
+SCAN_URL_TTL = int(os.getenv('SCAN_URL_TTL', '3600'))
+
+# The local file server; SCAN_SERVER_URL is its address as browsers see it
+SCAN_SERVER_PORT = int(os.getenv('SCAN_SERVER_PORT', '8503'))
+SCAN_SERVER_URL = os.getenv('SCAN_SERVER_URL')
+# Signing key; a random one per process unless set
+SCAN_URL_SECRET = os.getenv('SCAN_URL_SECRET')
+
+# A Deep Zoom tile, ``<name>_files/<level>/<col>_<row>.<ext>``
+_TILE_RE = re.compile(r'(?P<pyramid>.+)_files/\d+/\d+_\d+\.[a-z]+')
+
+
+def url_expiry(now=None, ttl=SCAN_URL_TTL):
+    """Expiry time for URLs handed out now: the end of the next TTL window."""
+    now = time.time() if now is None else now
+    return (int(now // ttl) + 2) * ttl
+
+
+class UrlSigner:
+    """HMAC-signed, expiring URLs below ``base_url``."""
+
+    def __init__(self, base_url, secret=None):
+        self.base_url = base_url.rstrip('/')
+        self.secret = (secret.encode() if isinstance(secret, str) else secret) or os.urandom(32)
+
+    def _signature(self, path, expires):
+        return hmac.new(self.secret, f"{path}\n{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def sign(self, path, expires):
+        return f"{self.base_url}/{quote(path)}?expires={expires}&sig={self._signature(path, expires)}"
+
+    def verify(self, path, expires, signature, now=None):
+        now = time.time() if now is None else now
+        try:
+            if int(expires) < now:
+                return False
+        except (TypeError, ValueError):
+            return False
+        return hmac.compare_digest(self._signature(path, expires), signature or '')
+
+
+def serve_scans(storage, port=SCAN_SERVER_PORT, host='0.0.0.0', base_url=SCAN_SERVER_URL,
+                secret=SCAN_URL_SECRET):
+    """Serve ``storage`` over HTTP from a daemon thread, for signed URLs only.
+
+    Responses carry an ETag and a private Cache-Control lifetime matching
+    the URL's expiry, so browsers reuse images instead of re-downloading
+    them. Files are written straight from their memory mapping. A signed
+    ``<name>.dzi`` URL also grants its tiles under ``<name>_files/``.
+    Returns the server; its ``signer`` makes URLs it accepts.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.do_GET(body=False)
+
+        def do_GET(self, body=True):
+            url = urlsplit(self.path)
+            path = unquote(url.path).lstrip('/')
+            query = parse_qs(url.query)
+            expires = query.get('expires', [None])[0]
+            signature = query.get('sig', [None])[0]
+            # Deep-zoom viewers request a pyramid's tiles with the query
+            # string of its .dzi URL, so that signature covers them too:
+            # only for canonical tile paths, so ../ or // segments can never
+            # stretch it to files outside the pyramid
+            canonical = posixpath.normpath(path) == path and '..' not in path.split('/')
+            tile = _TILE_RE.fullmatch(path) if canonical else None
+            if not (server.signer.verify(path, expires, signature)
+                    or (tile and server.signer.verify(f"{tile['pyramid']}.dzi", expires, signature))):
+                self.send_error(403)
+                return
+            try:
+                version = storage.stat(path).version
+                etag = f'"{version}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                data = storage.get_bytes(path)
+            except (FileNotFoundError, IsADirectoryError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', etag)
+            max_age = max(0, int(expires) - int(time.time()))
+            self.send_header('Cache-Control', f'private, max-age={max_age}, immutable')
+            # The signature is the access check; viewers load descriptors cross-origin
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            if body:
+                self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # one line per image would drown the app log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.signer = UrlSigner(base_url or f"http://localhost:{server.server_address[1]}", secret)
+    threading.Thread(target=server.serve_forever, daemon=True, name='scan-server').start()
+    return server
@@ -0,0 +1,181 @@
+import mmap
+import os
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from scans import SCAN_FETCH_CONCURRENCY, SCAN_FETCH_TIMEOUT, download_blob, fetch_blobs
+
+# Where scans are served from: 'gcs' (the GCS_BUCKET_NAME bucket) or 'local'
+# (files under SCAN_LOCAL_ROOT, for single-host deployments and offline work)
+SCAN_STORAGE = os.getenv('SCAN_STORAGE', 'gcs')
+GCS_BUCKET_NAME = os.getenv('GCS_BUCKET_NAME')
+SCAN_LOCAL_ROOT = os.getenv('SCAN_LOCAL_ROOT', 'dataset')
+
+# ``version`` changes whenever the content does: the GCS generation, or the
+# modification time and size of a local file
+BlobStat = namedtuple('BlobStat', ['size', 'version'])
+
+
+def storage_path(scan_path):
+    """Path of a scan within the storage root, from the path recorded at import.
+
+    init_db.py records scans by their local path (``dataset/originals/...``,
+    possibly absolute); storage keys start below ``dataset/``.
+    """
+    _, sep, rest = scan_path.partition('dataset/')
+    return rest if sep else scan_path
+
+
+class ScanStorage:
+    """Where scan bytes come from. Paths are relative to the storage root.
+
+    ``remote`` tells callers whether reads cost a network round trip and so
+    are worth caching in memory and on disk. Missing paths raise
+    ``FileNotFoundError`` from every method.
+    """
+
+    remote = True
+    name = None
+
+    def get_bytes(self, path):
+        """The whole object."""
+        raise NotImplementedError
+
+    def get_range(self, path, start, end=None):
+        """Bytes ``start`` up to (not including) ``end``, like slicing."""
+        raise NotImplementedError
+
+    def stat(self, path):
+        """``BlobStat(size, version)`` without reading the content."""
+        raise NotImplementedError
+
+    def signed_url(self, path, expires):
+        """A URL browsers can fetch the object from until ``expires`` (Unix time)."""
+        raise NotImplementedError
+
+    def get_many(self, paths, max_workers=SCAN_FETCH_CONCURRENCY):
+        """Read several objects concurrently, yielding in completion order.
+
+        Yields ``(path, data, error)`` tuples where exactly one of ``data``
+        and ``error`` is set, so one failed page does not hide the others.
+        """
+        raise NotImplementedError
+
+
+class GCSStorage(ScanStorage):
+    """Scans in a Google Cloud Storage bucket, optionally behind a ``DiskCache``."""
+
+    def __init__(self, bucket, timeout=SCAN_FETCH_TIMEOUT, disk_cache=None):
+        self.bucket = bucket
+        self.timeout = timeout
+        self.disk_cache = disk_cache
+        self.name = f"gs://{bucket.name}"
+
+    def get_bytes(self, path):
+        return download_blob(self.bucket, path, self.timeout, self.disk_cache)
+
+    def get_range(self, path, start, end=None):
+        if end is not None and end <= start:
+            return b''
+        # GCS ranges include their last byte
+        return self.bucket.blob(path).download_as_bytes(
+            start=start, end=None if end is None else end - 1, timeout=self.timeout
+        )
+
+    def stat(self, path):
+        blob = self.bucket.get_blob(path, timeout=self.timeout)
+        if blob is None:
+            raise FileNotFoundError(path)
+        return BlobStat(blob.size, blob.generation or blob.etag)
+
+    def signed_url(self, path, expires):
+        # Browsers then fetch straight from Cloud Storage
+        return self.bucket.blob(path).generate_signed_url(
+            version='v4', expiration=datetime.fromtimestamp(expires, timezone.utc), method='GET',
+            **self._signing_kwargs()
+        )
+
+    def _signing_kwargs(self):
+        """How to sign: with the credentials' private key, or through IAM signBlob.
+
+        Cloud Run and Compute Engine credentials have no private key, and
+        the client library refuses to sign with them unless it is given
+        the service account and a current access token, which it then
+        sends to the IAM signBlob API.
+        """
+        from google.auth.credentials import Signing
+        credentials = self.bucket.client._credentials
+        if isinstance(credentials, Signing):
+            return {}
+        if not credentials.valid:
+            # Also resolves the service account email of metadata-server credentials
+            from google.auth.transport.requests import Request
+            credentials.refresh(Request())
+        return {'service_account_email': credentials.service_account_email, 'access_token': credentials.token}
+
+    def get_many(self, paths, max_workers=SCAN_FETCH_CONCURRENCY):
+        return fetch_blobs(self.bucket, paths, max_workers, self.timeout, self.disk_cache)
+
+
+class LocalStorage(ScanStorage):
+    """Scans in a local directory, read through ``mmap`` without copying.
+
+    ``get_bytes`` and ``get_range`` return read-only memoryviews of the
+    mapped file, so the OS page cache is the only copy in memory; call
+    ``bytes()`` on them where a real bytes object is needed. Paths that
+    resolve outside ``root`` are treated as missing. Signed URLs need a
+    ``url_signer`` for a server that serves this directory, such as
+    ``scan_server.serve_scans()``.
+    """
+
+    remote = False
+
+    def __init__(self, root=SCAN_LOCAL_ROOT, url_signer=None):
+        self.root = os.path.realpath(root)
+        self.name = f"file://{self.root}"
+        self.url_signer = url_signer
+
+    def resolve(self, path):
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([full_path, self.root]) != self.root:
+            raise FileNotFoundError(path)
+        return full_path
+
+    def get_bytes(self, path):
+        with open(self.resolve(path), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'')
+            # The mapping stays valid after the file is closed, for as long
+            # as the returned view is referenced
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def get_range(self, path, start, end=None):
+        return self.get_bytes(path)[start:end]
+
+    def stat(self, path):
+        st = os.stat(self.resolve(path))
+        return BlobStat(st.st_size, f"{st.st_mtime_ns}-{st.st_size}")
+
+    def signed_url(self, path, expires):
+        if self.url_signer is None:
+            raise NotImplementedError("Local scans have no URLs without a scan server")
+        return self.url_signer.sign(path, expires)
+
+    def get_many(self, paths, max_workers=SCAN_FETCH_CONCURRENCY):
+        # Mapping a file takes microseconds; threads would only add overhead
+        for path in paths:
+            try:
+                yield path, self.get_bytes(path), None
+            except Exception as e:
+                yield path, None, e
+
+
+def open_storage(backend=SCAN_STORAGE, disk_cache=None):
+    """The storage backend selected by SCAN_STORAGE, configured from the environment."""
+    if backend == 'local':
+        return LocalStorage(SCAN_LOCAL_ROOT)
+    if backend == 'gcs':
+        # Imported here so cold starts and local-only deployments don't pay for it
+        from google.cloud import storage
+        return GCSStorage(storage.Client().bucket(GCS_BUCKET_NAME), disk_cache=disk_cache)
+    raise ValueError(f"Unknown SCAN_STORAGE {backend!r}, expected 'gcs' or 'local'")
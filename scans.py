@@ -0,0 +1,252 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Total size of compressed scan bytes kept in memory per server process
+SCAN_CACHE_BYTES = int(os.getenv('SCAN_CACHE_MB', '256')) * 1024 * 1024
+
+# On-disk tier below the memory cache, shared by all worker processes on the
+# host and surviving restarts. Set SCAN_DISK_CACHE_MB=0 to disable it.
+SCAN_DISK_CACHE_DIR = os.getenv(
+    'SCAN_DISK_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'family-letters-scans')
+)
+SCAN_DISK_CACHE_BYTES = int(os.getenv('SCAN_DISK_CACHE_MB', '2048')) * 1024 * 1024
+
+# Pages of one letter are downloaded in parallel, up to this many at a time
+SCAN_FETCH_CONCURRENCY = int(os.getenv('SCAN_FETCH_CONCURRENCY', '4'))
+SCAN_FETCH_TIMEOUT = float(os.getenv('SCAN_FETCH_TIMEOUT', '30'))  # seconds per blob
+
+# Rendered width in pixels of one column of the two-column scan layout
+SCAN_DISPLAY_WIDTH = int(os.getenv('SCAN_DISPLAY_WIDTH', '800'))
+
+
+def pick_derivative(derivatives, target_width=SCAN_DISPLAY_WIDTH):
+    """Pick the smallest (width, path) derivative that still fills ``target_width``.
+
+    Derivatives only exist for widths below the original's, so when none is
+    wide enough the original itself is the best fit and None is returned.
+    """
+    for width, path in sorted(derivatives or []):
+        if width >= target_width:
+            return path
+    return None
+
+
+class ScanCache:
+    """Process-wide LRU cache of compressed scan bytes with a byte budget.
+
+    Entries are the encoded files exactly as downloaded (PNG, WebP, ...),
+    which are several times smaller than decoded bitmaps; callers decode on
+    demand. The least recently used entries are evicted once the total size
+    exceeds ``max_bytes``. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, max_bytes=SCAN_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        size = len(data)
+        if size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = data
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class DiskCache:
+    """Content-addressed on-disk cache of remote scan bytes.
+
+    Files are named by a hash of the blob key and its version (the GCS
+    generation), so a changed blob simply misses instead of needing
+    invalidation. Writes go to a temporary file that is atomically renamed
+    into place, which makes the directory safe to share between several
+    Streamlit worker processes. Reads touch the file's mtime, which eviction
+    uses as its LRU clock, and return a read-only memoryview of the mapped
+    file without copying it; the mapping outlives eviction of the file for
+    as long as the view is referenced, and holds a file descriptor open
+    meanwhile, so copy whatever is kept for long.
+    """
+
+    # Re-measure the directory every this many writes, since other
+    # processes add files too
+    RESCAN_EVERY = 64
+
+    def __init__(self, directory=SCAN_DISK_CACHE_DIR, max_bytes=SCAN_DISK_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._approx_bytes = None
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, version):
+        digest = hashlib.sha256(f"{key}\0{version}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key, version):
+        path = self._path(key, version)
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    data = memoryview(b'')
+                else:
+                    data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            os.utime(path)
+        except FileNotFoundError:
+            # Missing, or evicted by another process between open and utime
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, version, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._writes += 1
+            rescan = self._approx_bytes is None or self._writes % self.RESCAN_EVERY == 0
+            if not rescan:
+                self._approx_bytes += len(data)
+                rescan = self._approx_bytes > self.max_bytes
+        if rescan:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the cache fits its budget."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        if total > self.max_bytes:
+            # Evict down to 90% so every write does not trigger another scan
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._approx_bytes = total
+            self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'approx_bytes': self._approx_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def download_blob(bucket, blob_path, timeout=SCAN_FETCH_TIMEOUT, disk_cache=None):
+    """Download one blob, from ``disk_cache`` when its current generation is there."""
+    if disk_cache is None:
+        return bucket.blob(blob_path).download_as_bytes(timeout=timeout)
+    # A metadata-only request tells us the current generation; the bytes are
+    # only downloaded when this generation is not on disk yet.
+    blob = bucket.get_blob(blob_path, timeout=timeout)
+    if blob is None:
+        raise FileNotFoundError(blob_path)
+    key = f"{bucket.name}/{blob_path}"
+    version = blob.generation or blob.etag
+    data = disk_cache.get(key, version)
+    if data is None:
+        data = blob.download_as_bytes(timeout=timeout)
+        disk_cache.put(key, version, data)
+    return data
+
+
+def fetch_blobs(bucket, blob_paths, max_workers=SCAN_FETCH_CONCURRENCY, timeout=SCAN_FETCH_TIMEOUT,
+                disk_cache=None):
+    """Download blobs concurrently, yielding results in completion order.
+
+    ``bucket`` is anything with a ``blob(path).download_as_bytes(timeout=...)``
+    interface, such as a ``google.cloud.storage.Bucket``. With a
+    ``disk_cache``, each blob is revalidated with ``bucket.get_blob()`` and
+    served from disk when its generation is already cached. Yields
+    ``(blob_path, data, error)`` tuples where exactly one of ``data`` and
+    ``error`` is set, so one failed page does not hide the others.
+    """
+    if not blob_paths:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(blob_paths))) as executor:
+        futures = {
+            executor.submit(download_blob, bucket, blob_path, timeout, disk_cache): blob_path
+            for blob_path in blob_paths
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
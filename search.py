@@ -0,0 +1,405 @@
+import html
+import re
+
+# bm25() column weights for letters_fts(content, description, date): a hit in
+# the short filename description says more than one buried in a long body.
+BM25_WEIGHTS = (1.0, 2.0, 0.0)
+
+SORT_OPTIONS = ("date", "relevance")
+
+# "words" searches the word index, "substring" the trigram index (any part
+# of a word, at least three characters), and "fuzzy" rewrites each word to
+# also match close spellings before searching the word index.
+MATCH_MODES = ("words", "substring", "fuzzy")
+
+# Fuzzy search expands a word to at most this many indexed words
+FUZZY_MAX_EXPANSIONS = 8
+
+# While typing, a last word this long is searched as a prefix (``gar*``)
+# and completed from the index vocabulary; shorter ones are left out until
+# they grow. Matches the two- and three-letter prefix indexes of letters_fts.
+PREFIX_MIN_CHARS = 2
+SUGGESTION_LIMIT = 8
+
+# Letters listed per page of results
+PAGE_SIZE = 50
+
+# Timeline bucket -> length of the ISO date prefix naming it ("1943", "1943-01")
+TIMELINE_GRANULARITIES = {"year": 4, "month": 7}
+
+# snippet()/highlight() wrap matched terms in these control characters; they
+# survive HTML escaping and text cleaning (which spaces text around them as
+# if they weren't there) and become <mark> tags.
+MARK_START = "\x02"
+MARK_END = "\x03"
+SNIPPET_TOKENS = 24
+# The trigram index has a token per character, so its excerpts need about
+# as many tokens as SNIPPET_TOKENS words have characters
+TRIGRAM_SNIPPET_TOKENS = 140
+
+_TOKEN_RE = re.compile(r'"[^"]*"?\*?|\(|\)|[^\s"()]+')
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def to_fts_query(search_query):
+    """Translate free-text sidebar input into a safe FTS5 MATCH expression.
+
+    Supports "quoted phrases", prefix terms (``word*``) and the boolean
+    operators AND, OR and NOT (upper case, as in FTS5) with parentheses.
+    Everything else is quoted so punctuation in OCR text or user input can
+    never produce an FTS5 syntax error. Returns an empty string if nothing
+    searchable is left.
+    """
+    items = []
+    for token in _TOKEN_RE.findall(search_query or ""):
+        if token in ("(", ")"):
+            items.append((token, token))
+        elif token in _OPERATORS:
+            items.append(("op", token))
+        else:
+            prefix = token.endswith("*")
+            text = token.rstrip("*").replace('"', " ").strip()
+            if text:
+                items.append(("term", f'"{text}"' + ("*" if prefix else "")))
+
+    out = []
+    depth = 0
+    for kind, value in items:
+        last = out[-1][0] if out else None
+        if kind == "op":
+            # Operators are binary in FTS5; drop any that lack a left operand
+            # and let a later operator replace a dangling one.
+            if last in ("term", ")"):
+                out.append((kind, value))
+            elif last == "op":
+                out[-1] = (kind, value)
+            continue
+        if kind == ")":
+            if depth == 0 or last in (None, "("):
+                if last == "(":
+                    out.pop()
+                    depth -= 1
+                continue
+            if last == "op":
+                out.pop()
+            depth -= 1
+            out.append((kind, value))
+            continue
+        # A term or an opening parenthesis: FTS5 only allows implicit AND
+        # between plain phrases, so spell it out when a group is involved.
+        if last in ("term", ")") and (kind == "(" or last == ")"):
+            out.append(("op", "AND"))
+        if kind == "(":
+            depth += 1
+        out.append((kind, value))
+
+    # Trim trailing operators and empty groups, then close open groups.
+    while out and (out[-1][0] == "op" or out[-1][0] == "("):
+        if out.pop()[0] == "(":
+            depth -= 1
+    out.extend([(")", ")")] * depth)
+    if not any(kind == "term" for kind, _ in out):
+        return ""
+    return " ".join(value for _, value in out)
+
+
+def to_substring_query(search_query):
+    """Translate sidebar input into a trigram MATCH expression requiring every term.
+
+    Each word or "quoted phrase" must appear somewhere in the letter, also
+    inside longer words; operators and ``*`` are ignored. Terms shorter
+    than three characters cannot be looked up in a trigram index and are
+    dropped. Returns an empty string if nothing searchable is left.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(search_query or ""):
+        text = " ".join(token.rstrip("*").replace('"', " ").split())
+        if token not in _OPERATORS and len(text) >= 3:
+            terms.append(f'"{text}"')
+    return " AND ".join(terms)
+
+
+def _fts_match(search_query, match_mode):
+    """The FTS5 table to search and the MATCH expression for it."""
+    if match_mode == "substring":
+        return "letters_trigram", to_substring_query(search_query)
+    return "letters_fts", to_fts_query(search_query)
+
+
+def _filter_clauses(search_query, start_date, end_date, senders=(), recipients=(), match_mode="words"):
+    """FROM and WHERE clauses with parameters shared by the list and count queries.
+
+    ``senders`` and ``recipients`` are ``people`` ids; a letter must be from
+    any of the senders and to any of the recipients, looked up through the
+    letter_people person index.
+    """
+    params = [str(start_date), str(end_date)]
+    if not search_query:
+        from_clause, where = "FROM letters l", "l.date BETWEEN ? AND ?"
+    else:
+        table, match = _fts_match(search_query, match_mode)
+        if not match:
+            # Nothing searchable (e.g. only punctuation): match no letters
+            # rather than silently showing the whole archive.
+            return "FROM letters l", "0", []
+        from_clause = f"FROM {table} JOIN letters l ON l.id = {table}.rowid"
+        where = f"{table} MATCH ? AND l.date BETWEEN ? AND ?"
+        params = [match] + params
+
+    for role, person_ids in (("from", senders), ("to", recipients)):
+        if person_ids:
+            where += f"""
+                AND l.id IN (
+                    SELECT letter_id FROM letter_people
+                    WHERE person_id IN ({", ".join("?" * len(person_ids))}) AND role = '{role}'
+                )"""
+            params += list(person_ids)
+    return from_clause, where, params
+
+
+def build_search_query(search_query, start_date, end_date, order_by="date",
+                       after=None, page_size=PAGE_SIZE, senders=(), recipients=(), match_mode="words"):
+    """Build the query for one page of the letter list and its parameters.
+
+    With a search term the query runs against the ``letters_fts`` index, or
+    ``letters_trigram`` in substring mode, and joins back to ``letters``;
+    ``order_by`` picks newest-first or bm25 relevance. Without one it is a
+    plain date range scan.
+
+    Pages use keyset pagination: every row carries a ``sort_key`` column,
+    and passing the last row's ``(sort_key, id)`` as ``after`` continues
+    from there, so later pages cost the same as the first. One row more
+    than ``page_size`` is fetched to tell whether another page follows.
+
+    Only the metadata shown in the list is selected; letter bodies and scan
+    paths are fetched one letter at a time when a row is expanded.
+    """
+    from_clause, where, params = _filter_clauses(
+        search_query, start_date, end_date, senders, recipients, match_mode
+    )
+    searching = bool(search_query) and where != "0"
+    table, match = _fts_match(search_query, match_mode)
+    if searching and order_by == "relevance":
+        # The trigram table has no date column
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS[:2 if table == "letters_trigram" else 3])
+        sort_key, direction, comparison = f"bm25({table}, {weights})", "ASC", ">"
+    else:
+        sort_key, direction, comparison = "l.date", "DESC", "<"
+
+    if after is not None:
+        where += f" AND ({sort_key}, l.id) {comparison} (?, ?)"
+        params = params + list(after)
+    query = f"""
+        SELECT l.id, l.date, l.date_precision, l.description, {sort_key} AS sort_key{"" if searching else ", NULL AS snippet"}
+        {from_clause}
+        WHERE {where}
+        ORDER BY {sort_key} {direction}, l.id {direction}
+        LIMIT ?
+    """
+    params = params + [page_size + 1]
+    if not searching:
+        return query, params
+
+    # Excerpts with the matches marked are built only for the rows of this
+    # page; in the inner query SQLite would make one for every match before
+    # sorting.
+    snippet_tokens = TRIGRAM_SNIPPET_TOKENS if table == "letters_trigram" else SNIPPET_TOKENS
+    query = f"""
+        SELECT page.*, (
+            SELECT snippet({table}, 0, ?, ?, '…', {snippet_tokens})
+            FROM {table} WHERE {table} MATCH ? AND rowid = page.id
+        ) AS snippet
+        FROM ({query}) AS page
+        ORDER BY page.sort_key {direction}, page.id {direction}
+    """
+    return query, [MARK_START, MARK_END, match] + params
+
+
+def build_count_query(search_query, start_date, end_date, senders=(), recipients=(), match_mode="words"):
+    """Build a query counting every letter matching the filters."""
+    from_clause, where, params = _filter_clauses(
+        search_query, start_date, end_date, senders, recipients, match_mode
+    )
+    return f"SELECT COUNT(*) {from_clause} WHERE {where}", params
+
+
+def build_timeline_query(search_query, granularity="year", first=None, last=None,
+                         senders=(), recipients=(), match_mode="words"):
+    """Build a query counting matching letters per year or month, oldest first.
+
+    Rows are ``(period, letters)``, where ``period`` is a date prefix such
+    as ``1943`` or ``1943-01``; ``first`` and ``last`` bound it, inclusive.
+    Browsing the whole archive reads the per-period totals init_db.py keeps
+    in ``timeline_counts``; a search or correspondent filter groups the
+    matching letters in one aggregate query. Empty periods are left out.
+    """
+    length = TIMELINE_GRANULARITIES[granularity]
+    first, last = first or "0000", last or "9999"
+    if not (search_query or senders or recipients):
+        return """
+            SELECT period, letters FROM timeline_counts
+            WHERE granularity = ? AND period BETWEEN ? AND ?
+            ORDER BY period
+        """, [granularity, first, last]
+
+    from_clause, where, params = _filter_clauses(
+        search_query, "0000-01-01", "9999-12-31", senders, recipients, match_mode
+    )
+    return f"""
+        SELECT substr(l.date, 1, {length}) AS period, COUNT(*) AS letters
+        {from_clause}
+        WHERE {where} AND period BETWEEN ? AND ?
+        GROUP BY period
+        ORDER BY period
+    """, params + [first, last]
+
+
+def build_highlight_query(search_query, letter_id, match_mode="words"):
+    """Build a query returning one letter's full content with matches marked."""
+    table, match = _fts_match(search_query, match_mode)
+    query = f"""
+        SELECT highlight({table}, 0, ?, ?)
+        FROM {table}
+        WHERE {table} MATCH ? AND rowid = ?
+    """
+    return query, [MARK_START, MARK_END, match, letter_id]
+
+
+def fuzzy_distance(term):
+    """Edits a fuzzy search allows for a word: none for short words, then one or two."""
+    if len(term) <= 3:
+        return 0
+    return 1 if len(term) <= 6 else 2
+
+
+def build_vocab_query(term, max_distance):
+    """Build a query for the indexed words that could be within ``max_distance`` edits of the term.
+
+    Candidates share the term's first letter, a seek into word_counts,
+    and have a length within ``max_distance`` of the term's; closest_terms()
+    measures the rest. Misspellings of the first letter are not found.
+    """
+    query = """
+        SELECT term, letters FROM word_counts
+        WHERE term >= ? AND term < ? AND length BETWEEN ? AND ?
+    """
+    return query, [term[0], chr(ord(term[0]) + 1), len(term) - max_distance, len(term) + max_distance]
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between two strings, or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def closest_terms(term, vocab_rows, max_distance, limit=FUZZY_MAX_EXPANSIONS):
+    """Indexed words within ``max_distance`` edits of ``term``, closest and most common first.
+
+    ``vocab_rows`` are the ``(term, letters)`` rows of build_vocab_query().
+    """
+    matches = []
+    for candidate, letters in vocab_rows:
+        distance = edit_distance(term, candidate, max_distance)
+        if distance <= max_distance:
+            matches.append((distance, -letters, candidate))
+    return [candidate for _, _, candidate in sorted(matches)[:limit]]
+
+
+def fuzzy_terms(search_query):
+    """The plain words of a search that fuzzy mode expands, lower-cased like the index."""
+    terms = []
+    for token in _TOKEN_RE.findall(search_query or ""):
+        if token not in _OPERATORS and token not in ("(", ")") and '"' not in token and "*" not in token:
+            terms.extend(word for word in re.findall(r"\w+", token.lower()) if word not in terms)
+    return terms
+
+
+def expand_fuzzy_query(search_query, expansions):
+    """Rewrite a search so each plain word also matches its close spellings.
+
+    ``expansions`` maps fuzzy_terms() to their closest_terms(); a word
+    becomes ``(word OR spelling OR ...)``, so the result is an ordinary
+    word search that to_fts_query() and every query builder accept.
+    Phrases, prefix terms and operators are kept as typed.
+    """
+    def expand(match):
+        token = match.group()
+        if token in _OPERATORS or token in ("(", ")") or '"' in token or "*" in token:
+            return token
+        words = []
+        for word in re.findall(r"\w+", token.lower()):
+            alternatives = [word] + [term for term in expansions.get(word, ()) if term != word]
+            words.append(f"({' OR '.join(alternatives)})" if len(alternatives) > 1 else word)
+        return " ".join(words)
+
+    return _TOKEN_RE.sub(expand, search_query or "")
+
+
+def marks_to_html(escaped_text):
+    """Turn snippet()/highlight() markers in already-escaped HTML into <mark> tags."""
+    return escaped_text.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def snippet_html(snippet):
+    """Render a snippet() excerpt as one line of escaped HTML with matches marked."""
+    return marks_to_html(html.escape(" ".join(snippet.split()), quote=False))
+
+
+def _last_word(search_query):
+    """The match for a plain word being typed at the end of the search, or None."""
+    if not search_query or search_query[-1].isspace():
+        return None
+    tokens = list(_TOKEN_RE.finditer(search_query))
+    if not tokens:
+        return None
+    token = tokens[-1].group()
+    if token in _OPERATORS or token in ("(", ")") or '"' in token or "*" in token:
+        return None
+    return tokens[-1]
+
+
+def incremental_query(search_query, min_chars=PREFIX_MIN_CHARS):
+    """The search to run for input that is still being typed.
+
+    A plain last word is unfinished: it becomes a prefix term once it has
+    ``min_chars`` characters and is left out before that, so "garden t"
+    keeps showing the letters about gardens. Input ending in a space,
+    phrase, prefix term or operator is searched as typed.
+    """
+    word = _last_word(search_query)
+    if word is None:
+        return search_query
+    if len(word.group()) < min_chars:
+        return search_query[:word.start()]
+    return search_query + "*"
+
+
+def last_word_prefix(search_query, min_chars=PREFIX_MIN_CHARS):
+    """The lower-cased word being typed at the end of the search, if long enough to complete."""
+    word = _last_word(search_query)
+    prefix = word.group().lower() if word else ""
+    return prefix if len(prefix) >= min_chars and re.fullmatch(r"\w+", prefix) else ""
+
+
+def build_suggestion_query(prefix, limit=SUGGESTION_LIMIT):
+    """Build a query for the indexed words starting with ``prefix``, in most letters first.
+
+    The term range is a seek into the fts5vocab table, not a scan of the
+    whole vocabulary.
+    """
+    query = """
+        SELECT term, doc FROM letters_vocab
+        WHERE term >= ? AND term < ?
+        ORDER BY doc DESC, term
+        LIMIT ?
+    """
+    return query, [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1), limit]
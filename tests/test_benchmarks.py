@@ -0,0 +1,48 @@
+import json
+import os
+import sqlite3
+
+from benchmarks.compare import compare
+from benchmarks.corpus import generate_corpus
+from benchmarks.run import SEARCHES, bench_search
+from init_db import ScanIndex, get_base_filename, import_letters, init_db, parse_date
+
+
+def test_corpus_follows_dataset_conventions(tmp_path):
+    text_dir, scan_dir = generate_corpus(str(tmp_path), 300, seed=1)
+    texts = sorted(os.listdir(text_dir))
+    assert len(texts) == 300
+    assert all(parse_date(name) for name in texts)
+
+    bases = [get_base_filename(name) for name in texts]
+    index = ScanIndex(scan_dir)
+    for base in bases:
+        pages = index.find(base)
+        # Every page found belongs to this letter and no other
+        assert pages and {get_base_filename(os.path.basename(p)) for p in pages} == {base}
+    assert sum(len(index.find(base)) for base in bases) == len(os.listdir(scan_dir))
+
+    # Same seed, same corpus
+    generate_corpus(str(tmp_path / "again"), 300, seed=1)
+    assert sorted(os.listdir(tmp_path / "again" / "text" / "final")) == texts
+
+
+def test_search_benchmark_runs_on_imported_corpus(tmp_path):
+    text_dir, scan_dir = generate_corpus(str(tmp_path), 100)
+    db_path = str(tmp_path / "letters.db")
+    init_db(db_path)
+    import_letters(text_dir, scan_dir, db_path, max_workers=1)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM letters WHERE scan_paths != '[]'").fetchone()[0] == 100
+
+    results = bench_search(db_path, repeat=1)
+    assert set(results) == set(SEARCHES) | {"browse", "timeline", "correspondents", "fuzzy", "typing"}
+    assert results["no_match"]["matches"] == 0
+    assert results["common_word"]["matches"] > 0
+    json.dumps(results)
+
+
+def test_compare_reports_relative_change():
+    old = {"commit": "a", "cpu_count": 8, "sizes": {"1000": {"import": {"import_s": 2.0}}}}
+    new = {"commit": "b", "cpu_count": 8, "sizes": {"1000": {"import": {"import_s": 1.5}}}}
+    assert list(compare(old, new)) == [("sizes.1000.import.import_s", 2.0, 1.5, -0.25)]
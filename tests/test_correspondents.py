@@ -0,0 +1,55 @@
+import pytest
+
+from correspondents import extract_correspondents, from_description, from_text, normalize_name
+
+
+@pytest.mark.parametrize("description, expected", [
+    ("Letter from Harold to Ruth", (["Harold"], ["Ruth"])),
+    ("Letter 2 from Mother and Father to Harold", (["Mother", "Father"], ["Harold"])),
+    ("Christmas card from Aunt Edna", (["Aunt Edna"], [])),
+    ("Trip to the coast", ([], [])),
+    # Descriptive text after the names is not part of them
+    ("Letter from Harold to Ruth about the farm", (["Harold"], ["Ruth"])),
+    ("Letter from Harold in France", (["Harold"], [])),
+    ("Letter from Harold re: the farm", (["Harold"], [])),
+    ("Letter from Harold to Ruth - censored", (["Harold"], ["Ruth"])),
+    ("Letter from Mom, written on train", (["Mom"], [])),
+    ("Letter from Harold, Camp Roberts", (["Harold"], [])),
+    ("Letter to Ruth from Harold", (["Harold"], ["Ruth"])),
+    ("Letter to Ruth from Harold, Camp Roberts", (["Harold"], ["Ruth"])),
+    ("Letter from the front", ([], [])),
+])
+def test_from_description(description, expected):
+    assert from_description(description) == expected
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("Dear Ruth,\n\nAll is well.\n\nLove,\nHarold", (["Harold"], ["Ruth"])),
+    ("My dearest Mother and Dad -\nNews.\nYour loving son,\nHarold", (["Harold"], ["Mother", "Dad"])),
+    # A closing-like sentence followed by more text, not a signature
+    ("Dear Ruth,\nNews.\nYour father is well.\nGive love to Sis", ([], ["Ruth"])),
+    ("Dear Ruth,\nNews.\nLove,\nharold", ([], ["Ruth"])),
+    ("Dear friend,\n\nNews.\n\nLove, Uncle Walter", (["Uncle Walter"], [])),
+    ("Dear Ruth, the camp is cold but the food is good.", ([], ["Ruth"])),
+    ("No salutation.\nNo signature either.", ([], [])),
+])
+def test_from_text(content, expected):
+    assert from_text(content) == expected
+
+
+def test_normalize_name():
+    assert normalize_name("  Aunt  Edna. ") == "Aunt Edna"
+    assert normalize_name("McArthur") == "McArthur"
+    assert normalize_name("Ludwig van Beethoven") == "Ludwig van Beethoven"
+    # Lower-case words are text, not names
+    assert normalize_name("aunt edna") is None
+    assert normalize_name("Give love to Sis") is None
+    assert normalize_name("Everyone") is None
+    assert normalize_name("the whole family back at the farm") is None
+    assert normalize_name("B12") is None
+
+
+def test_filename_wins_over_text():
+    assert extract_correspondents("Postcard from Harold", "Dear Ruth,\nHello.\nLove,\nWalter") == [
+        ("Harold", "from", "filename"), ("Ruth", "to", "text"),
+    ]
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+import pytest
+
+from db import ConnectionPool, connect_readonly
+from init_db import init_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "letters.db"
+    init_db(path)
+    return path
+
+
+def test_connection_is_read_only_and_tuned(db_path):
+    conn = connect_readonly(db_path)
+    assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] < 0
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM letters")
+    conn.close()
+
+
+def test_missing_database_is_not_created(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        connect_readonly(tmp_path / "missing.db")
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_pool_reuses_connections(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    pool.close()
+
+
+def test_pool_blocks_at_capacity(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    acquired = threading.Event()
+
+    def worker():
+        with pool.connection():
+            acquired.set()
+
+    with pool.connection():
+        thread = threading.Thread(target=worker)
+        thread.start()
+        assert not acquired.wait(0.1)
+    thread.join(timeout=1)
+    assert acquired.is_set()
+    pool.close()
+
+
+def test_close_closes_connections(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    with pool.connection() as idle:
+        pass
+    with pool.connection() as busy:
+        pool.close()
+    for conn in (idle, busy):
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.connection():
+            pass
@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Cold-start budget for importing the app entry point, on top of Streamlit
+# itself. Cloud Run scales to zero, so this is latency every first visitor sees.
+IMPORT_BUDGET_SECONDS = 0.5
+
+# Only needed once a scan is shown, or not at all
+LAZY_MODULES = ["pandas", "PIL.Image", "google.cloud.storage"]
+
+MEASURE = """
+import json, sys, time
+import streamlit
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure_import():
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE % LAZY_MODULES],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_heavy_modules_are_imported_lazily():
+    assert measure_import()["loaded"] == []
+
+
+def test_app_import_within_budget():
+    # Best of three, to keep a busy CI machine from failing the build
+    seconds = min(measure_import()["seconds"] for _ in range(3))
+    assert seconds < IMPORT_BUDGET_SECONDS, f"importing app.py took {seconds:.3f}s"
@@ -0,0 +1,353 @@
+import os
+import sqlite3
+
+import pytest
+from PIL import Image
+
+import init_db as init_db_module
+from cleaning import CLEANER_VERSION, clean_text_content, format_letter_html
+from init_db import (
+    ScanIndex, generate_derivatives, generate_tile_pyramids, import_letters, init_db, make_derivatives,
+    make_tile_pyramid,
+    refresh_cleaned_content, refresh_correspondents,
+)
+
+
+@pytest.fixture
+def scan_dir(tmp_path):
+    scan_dir = tmp_path / "originals"
+    scan_dir.mkdir()
+    Image.new("RGB", (1200, 1600), "white").save(scan_dir / "1943-01-15 Letter - Page 1 of 2.png")
+    Image.new("RGB", (600, 800), "white").save(scan_dir / "1943-01-15 Letter - Page 2 of 2.png")
+    return scan_dir
+
+
+def test_generate_derivatives(tmp_path, scan_dir):
+    db_path = tmp_path / "letters.db"
+    out_dir = tmp_path / "derivatives"
+    init_db(db_path)
+    generate_derivatives(str(scan_dir), str(out_dir), db_path, max_workers=2)
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT original_path, width, height, path FROM scan_derivatives ORDER BY original_path, width"
+    ).fetchall()
+    page1 = str(scan_dir / "1943-01-15 Letter - Page 1 of 2.png")
+    page2 = str(scan_dir / "1943-01-15 Letter - Page 2 of 2.png")
+    # Only widths narrower than the original are produced
+    assert [(r[0], r[1], r[2]) for r in rows] == [(page1, 400, 533), (page1, 800, 1067), (page2, 400, 533)]
+    for row in rows:
+        with Image.open(row[3]) as image:
+            assert image.format == "WEBP"
+            assert image.width == row[1]
+
+    # Removing an original drops its derivatives on the next run
+    (scan_dir / "1943-01-15 Letter - Page 2 of 2.png").unlink()
+    generate_derivatives(str(scan_dir), str(out_dir), db_path, max_workers=2)
+    assert conn.execute("SELECT COUNT(*) FROM scan_derivatives").fetchone()[0] == 2
+    conn.close()
+
+
+def test_fresh_derivatives_skip_decoding(tmp_path, monkeypatch):
+    original = str(tmp_path / "page.png")
+    Image.new("RGBA", (1200, 1600), "white").save(original)
+    first = make_derivatives(original, str(tmp_path / "derivatives"))
+
+    def convert(*args, **kwargs):
+        raise AssertionError("decoded a scan whose derivatives are up to date")
+    monkeypatch.setattr(Image.Image, "convert", convert)
+    assert make_derivatives(original, str(tmp_path / "derivatives")) == first
+
+
+def test_make_tile_pyramid(tmp_path, scan_dir):
+    original = str(scan_dir / "1943-01-15 Letter - Page 1 of 2.png")
+    dzi_path, width, height = make_tile_pyramid(original, str(tmp_path / "tiles"), fmt="jpeg")
+    assert (width, height) == (1200, 1600)
+    files_dir = dzi_path[:-len(".dzi")] + "_files"
+    # 1600px needs levels 0 (1x1) to 11 (full size)
+    assert sorted(map(int, os.listdir(files_dir))) == list(range(12))
+    full = sorted(os.listdir(os.path.join(files_dir, "11")))
+    assert len(full) == 5 * 7  # ceil(1200 / 254) x ceil(1600 / 254)
+    with Image.open(os.path.join(files_dir, "11", "0_0.jpg")) as tile:
+        assert tile.size == (255, 255)  # one pixel of overlap on the inner edges
+    with Image.open(os.path.join(files_dir, "11", "1_1.jpg")) as tile:
+        assert tile.size == (256, 256)
+    with Image.open(os.path.join(files_dir, "0", "0_0.jpg")) as tile:
+        assert tile.size == (1, 1)
+
+    # An unchanged original is not cut again
+    mtime = os.path.getmtime(dzi_path)
+    assert make_tile_pyramid(original, str(tmp_path / "tiles"), fmt="jpeg") == (dzi_path, 1200, 1600)
+    assert os.path.getmtime(dzi_path) == mtime
+
+
+def test_generate_tile_pyramids(tmp_path, scan_dir):
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    generate_tile_pyramids(str(scan_dir), str(tmp_path / "tiles"), db_path, max_workers=2)
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT original_path, dzi_path, width, height FROM scan_tiles ORDER BY original_path").fetchall()
+    assert [(r[0], r[2], r[3]) for r in rows] == [
+        (str(scan_dir / "1943-01-15 Letter - Page 1 of 2.png"), 1200, 1600),
+        (str(scan_dir / "1943-01-15 Letter - Page 2 of 2.png"), 600, 800),
+    ]
+    assert all(os.path.exists(r[1]) for r in rows)
+
+    (scan_dir / "1943-01-15 Letter - Page 2 of 2.png").unlink()
+    generate_tile_pyramids(str(scan_dir), str(tmp_path / "tiles"), db_path, max_workers=2)
+    assert conn.execute("SELECT COUNT(*) FROM scan_tiles").fetchone()[0] == 1
+    conn.close()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("\u201cDear Mother,\u201d she wrote \u2014 it\u2019s cold.", '"Dear Mother," she wrote - it\'s cold.'),
+    ("Caf\u00e9 au lait\u2026", "Caf au lait..."),
+    ("Company B12 and APO 503", "Company B 12 and APO 503"),
+    ("Dear Ruth,\n \n\n\nAll   is\twell.\nLove", "Dear Ruth,\n\nAll is well.\nLove"),
+    ("  \n padded \n  ", "padded"),
+    # Highlight markers around either side of a run-on don't change the spacing
+    ("abc\x021943\x03", "abc \x021943\x03"),
+    ("\x02abc\x031943", "\x02abc\x03 1943"),
+    ("\x02B12\x03", "\x02B 12\x03"),
+])
+def test_clean_text_content(raw, expected):
+    assert clean_text_content(raw) == expected
+
+
+def test_format_letter_html_escapes_and_splits_paragraphs():
+    assert format_letter_html("Dear Ruth,\n\nA <b> & c\nd") == "<p>Dear Ruth,</p><p>A &lt;b&gt; &amp; c\nd</p>"
+
+
+def test_cleaned_content_is_stored_and_versioned(tmp_path, monkeypatch):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-01-15 Letter.txt").write_text("Dear Ruth,\n\n\u201cHello\u201d", encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT content_html, cleaner_version FROM letters").fetchone() == (
+        '<p>Dear Ruth,</p><p>"Hello"</p>', CLEANER_VERSION
+    )
+
+    # A newer cleaner re-cleans rows written by the old one
+    monkeypatch.setattr(init_db_module, "CLEANER_VERSION", CLEANER_VERSION + 1)
+    monkeypatch.setattr(init_db_module, "format_letter_html", lambda text: "new")
+    refresh_cleaned_content(db_path)
+    assert conn.execute("SELECT content_html, cleaner_version FROM letters").fetchone() == (
+        "new", CLEANER_VERSION + 1
+    )
+    conn.close()
+
+
+def test_reimport_is_incremental(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-01-15 First.txt").write_text("training camp", encoding="utf-8")
+    (text_dir / "1943-02-01 Second.txt").write_text("garden", encoding="utf-8")
+    (text_dir / "1943-03-01 Third.txt").write_text("coast", encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    assert import_letters(str(text_dir), str(tmp_path), db_path)["imported"] == 3
+
+    # Nothing changed: nothing is written
+    assert import_letters(str(text_dir), str(tmp_path), db_path) == {
+        "imported": 0, "updated": 0, "unchanged": 3, "removed": 0, "errors": 0,
+    }
+
+    # Touched without changes, edited, deleted and added
+    os.utime(text_dir / "1943-01-15 First.txt", (1, 1))
+    (text_dir / "1943-02-01 Second.txt").write_text("orchard", encoding="utf-8")
+    (text_dir / "1943-03-01 Third.txt").unlink()
+    (text_dir / "1943-04-01 Fourth.txt").write_text("harbor", encoding="utf-8")
+    assert import_letters(str(text_dir), str(tmp_path), db_path) == {
+        "imported": 1, "updated": 1, "unchanged": 1, "removed": 1, "errors": 0,
+    }
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT description, content FROM letters ORDER BY date").fetchall() == [
+        ("First", "training camp"), ("Second", "orchard"), ("Fourth", "harbor"),
+    ]
+    conn.execute("INSERT INTO letters_fts(letters_fts) VALUES('integrity-check')")
+    conn.execute("INSERT INTO letters_trigram(letters_trigram) VALUES('integrity-check')")
+
+    def matches(term, table="letters_fts"):
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {table} MATCH ?", (term,)).fetchone()[0]
+
+    assert (matches("garden"), matches("orchard"), matches("coast"), matches("harbor")) == (0, 1, 0, 1)
+    assert (matches("arde", "letters_trigram"), matches("rcha", "letters_trigram")) == (0, 1)
+    conn.close()
+
+
+def test_scan_index_prefix_matches(tmp_path):
+    for name in [
+        "1943-01-15 Letter - Page 2 of 2.png", "1943-01-15 Letter - Page 1 of 2.png",
+        "1943-01-15 Letter to Ruth.png", "1943-01-15 Lettera.PNG", "1943-01-16 Letter.png",
+        "1943-01-15 Letter.txt",
+    ]:
+        (tmp_path / name).touch()
+    index = ScanIndex(str(tmp_path))
+    assert [os.path.basename(p) for p in index.find("1943-01-15 Letter")] == [
+        "1943-01-15 Letter - Page 1 of 2.png", "1943-01-15 Letter - Page 2 of 2.png",
+        "1943-01-15 Letter to Ruth.png", "1943-01-15 Lettera.PNG",
+    ]
+    assert index.find("1943-01-17") == []
+
+
+def test_parallel_import_matches_serial(tmp_path, monkeypatch):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    for i in range(1, 29):
+        (text_dir / f"1943-02-{i:02d} Letter {i}.txt").write_text(f"day {i}\n\nLove", encoding="utf-8")
+    (text_dir / "1943-02-29 Broken.txt").write_bytes(b"\xff\xfe not utf-8 \xff")
+
+    monkeypatch.setattr(init_db_module, "PARALLEL_IMPORT_THRESHOLD", 1)
+    monkeypatch.setattr(init_db_module, "IMPORT_BATCH_SIZE", 5)
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    counts = import_letters(str(text_dir), str(tmp_path), db_path, max_workers=2)
+    assert (counts["imported"], counts["errors"]) == (28, 1)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(DISTINCT id), MIN(id), MAX(id) FROM letters").fetchone() == (28, 1, 28)
+    assert conn.execute(
+        "SELECT content_html FROM letters WHERE description = 'Letter 7'"
+    ).fetchone() == ("<p>day 7</p><p>Love</p>",)
+    conn.execute("INSERT INTO letters_fts(letters_fts) VALUES('integrity-check')")
+    conn.close()
+
+
+def test_archive_meta_and_date_precision(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-06 Month only.txt").write_text("a", encoding="utf-8")
+    (text_dir / "1944-03-02 Full date.txt").write_text("b", encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT date, date_precision FROM letters ORDER BY date").fetchall() == [
+        ("1943-06-01", "month"), ("1944-03-02", "day"),
+    ]
+    meta = dict(conn.execute("SELECT key, value FROM archive_meta"))
+    assert meta["min_date"] == "1943-06-01"
+    assert meta["max_date"] == "1944-03-02"
+    assert meta["letter_count"] == 2
+    assert meta["schema_version"] == init_db_module.SCHEMA_VERSION
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM letters WHERE date BETWEEN ? AND ? ORDER BY date DESC",
+        ("1943-01-01", "1943-12-31"),
+    ).fetchall()
+    assert "idx_letters_date" in plan[0][3]
+    conn.close()
+
+
+def test_import_generation_counts_changes(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+
+    def generation():
+        row = conn.execute("SELECT value FROM archive_meta WHERE key = 'import_generation'").fetchone()
+        return row[0] if row else 0
+
+    (text_dir / "1943-01-15 Letter.txt").write_text("a", encoding="utf-8")
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    assert generation() == 1
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    assert generation() == 1
+    (text_dir / "1943-01-15 Letter.txt").write_text("b", encoding="utf-8")
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    assert generation() == 2
+    conn.close()
+
+
+def test_correspondents_follow_the_import(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-01-15 Letter from Harold to Ruth.txt").write_text("Dear Ruth,\nHi.\nLove,\nHarold")
+    (text_dir / "1943-02-01 Postcard from Harold.txt").write_text("Dear Mother,\nHi.")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    conn = sqlite3.connect(db_path)
+
+    def correspondents():
+        return sorted(conn.execute("""
+            SELECT l.description, lp.role, p.name, lp.source
+            FROM letter_people lp JOIN people p ON p.id = lp.person_id JOIN letters l ON l.id = lp.letter_id
+        """).fetchall())
+
+    assert correspondents() == [
+        ("Letter from Harold to Ruth", "from", "Harold", "filename"),
+        ("Letter from Harold to Ruth", "to", "Ruth", "filename"),
+        ("Postcard from Harold", "from", "Harold", "filename"),
+        ("Postcard from Harold", "to", "Mother", "text"),
+    ]
+
+    # Edits replace a letter's rows; people nobody writes to any more go away
+    (text_dir / "1943-02-01 Postcard from Harold.txt").write_text("Dear Aunt Edna,\nHi.")
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    assert ("Postcard from Harold", "to", "Aunt Edna", "text") in correspondents()
+    assert conn.execute("SELECT name FROM people ORDER BY name").fetchall() == [("Aunt Edna",), ("Harold",), ("Ruth",)]
+    (text_dir / "1943-01-15 Letter from Harold to Ruth.txt").unlink()
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    assert [row[2] for row in correspondents()] == ["Harold", "Aunt Edna"]
+
+    # Letters imported before correspondents were extracted get them on refresh
+    conn.execute("DELETE FROM letter_people")
+    conn.execute("UPDATE letters SET correspondents_version = NULL")
+    conn.commit()
+    refresh_correspondents(db_path)
+    assert len(correspondents()) == 2
+    conn.close()
+
+
+def test_word_index_gains_prefix_indexes(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-01-15 Letter.txt").write_text("training camp", encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    # A word index from before the prefix indexes
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TABLE letters_vocab")
+    conn.execute("DROP TABLE letters_fts")
+    conn.execute("""
+        CREATE VIRTUAL TABLE letters_fts USING fts5(
+            content, description, date, content='letters', content_rowid='id'
+        )
+    """)
+    conn.commit()
+
+    init_db(db_path)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'letters_fts'").fetchone()[0]
+    assert "prefix='2 3'" in sql
+    conn.execute("INSERT INTO letters_fts(letters_fts) VALUES('integrity-check')")
+    assert conn.execute("SELECT COUNT(*) FROM letters_fts WHERE letters_fts MATCH 'tr*'").fetchone()[0] == 1
+    assert conn.execute("SELECT doc FROM letters_vocab WHERE term = 'camp'").fetchone() == (1,)
+    conn.close()
+
+
+def test_word_counts_follow_imports(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    (text_dir / "1943-01-15 Letter.txt").write_text("training camp", encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    (text_dir / "1943-02-01 Letter.txt").write_text("back at camp", encoding="utf-8")
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT letters, length FROM word_counts WHERE term = 'camp'").fetchone() == (2, 4)
+    assert conn.execute("SELECT COUNT(*) FROM word_counts").fetchone() == \
+        conn.execute("SELECT COUNT(*) FROM letters_vocab").fetchone()
+    conn.close()
@@ -0,0 +1,99 @@
+import sqlite3
+
+import numpy as np
+
+from init_db import import_letters, init_db, update_related_letters
+from related import term_vector, tfidf, tokenize, top_neighbours
+
+TOPICS = {
+    "farm": "harvest tractor orchard tomatoes barn hay",
+    "army": "training camp convoy furlough sergeant rifle",
+    "sea": "lighthouse coast harbor sailing storm tide",
+    "school": "schoolhouse teacher lessons measles spelling chalk",
+}
+
+
+def write_letters(text_dir, count):
+    topics = list(TOPICS)
+    for i in range(count):
+        topic = topics[i % len(topics)]
+        (text_dir / f"1943-01-{i + 1:02d} Letter {i}.txt").write_text(
+            f"Dear Ruth,\n\nThe {TOPICS[topic]} news this week. Letter number {i}.\n\nLove,\nHarold",
+            encoding="utf-8",
+        )
+
+
+def related(conn, description):
+    return [row[0] for row in conn.execute("""
+        SELECT o.description FROM related_letters r
+        JOIN letters l ON l.id = r.letter_id
+        JOIN letters o ON o.id = r.related_id
+        WHERE l.description = ? ORDER BY r.rank
+    """, (description,))]
+
+
+def test_tokenize_and_term_vector():
+    assert tokenize("Dear Ruth, the HARVEST was good in 1943!") == ["ruth", "harvest"]
+    vector = term_vector("harvest harvest tractor", dims=64)
+    assert vector.dtype == np.float32 and np.count_nonzero(vector) == 2
+    assert np.array_equal(vector, term_vector("tractor harvest harvest", dims=64))
+
+
+def test_top_neighbours_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = tfidf(rng.random((50, 16), dtype=np.float32))
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    for row, neighbours, neighbour_scores in top_neighbours(vectors, range(50), top_k=3, batch_size=7):
+        assert list(neighbours) == list(np.argsort(-scores[row])[:3])
+        assert np.all(np.diff(neighbour_scores) <= 0)
+
+
+def test_related_letters_share_a_topic(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    write_letters(text_dir, 12)
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    counts = update_related_letters(db_path, top_k=2)
+    assert counts["full"] and counts["vectorised"] == 12
+
+    conn = sqlite3.connect(db_path)
+    # Letters 0, 4 and 8 are about the farm
+    assert sorted(related(conn, "Letter 0")) == ["Letter 4", "Letter 8"]
+    assert conn.execute("SELECT COUNT(*) FROM related_letters WHERE letter_id = related_id").fetchone()[0] == 0
+    assert (tmp_path / "letters.vectors.npy").exists()
+
+    # Nothing changed, nothing recomputed
+    counts = update_related_letters(db_path, top_k=2)
+    assert (counts["vectorised"], counts["rescored"], counts["full"]) == (0, 0, False)
+    conn.close()
+
+
+def test_related_letters_update_incrementally(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    write_letters(text_dir, 24)
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    update_related_letters(db_path, top_k=2)
+
+    # Letter 1 moves from the army to the farm, Letter 8 (farm) is deleted
+    (text_dir / "1943-01-02 Letter 1.txt").write_text(f"Dear Ruth, {TOPICS['farm']}", encoding="utf-8")
+    (text_dir / "1943-01-09 Letter 8.txt").unlink()
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    counts = update_related_letters(db_path, top_k=2)
+    assert (counts["vectorised"], counts["removed"], counts["full"]) == (1, 1, False)
+    assert counts["rescored"] < 24
+
+    conn = sqlite3.connect(db_path)
+    farm = {f"Letter {i}" for i in (0, 4, 12, 16, 20)}
+    assert set(related(conn, "Letter 1")) <= farm
+    assert "Letter 1" not in related(conn, "Letter 5")  # an army letter
+    assert not conn.execute("""
+        SELECT 1 FROM related_letters WHERE letter_id NOT IN (SELECT id FROM letters)
+           OR related_id NOT IN (SELECT id FROM letters)
+    """).fetchall()
+    conn.close()
@@ -0,0 +1,107 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from scan_server import UrlSigner, serve_scans, url_expiry
+from scan_storage import LocalStorage
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "originals").mkdir()
+    (tmp_path / "originals" / "page 1.png").write_bytes(b"\x89PNG page one")
+    (tmp_path / "secret.txt").write_bytes(b"outside")
+    storage = LocalStorage(str(tmp_path / "originals" / ".."))
+    server = serve_scans(storage, port=0, host="127.0.0.1", secret="test-secret")
+    storage.url_signer = server.signer
+    yield storage
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(url, headers=None):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, None
+
+
+def test_signed_url_serves_file_with_cache_headers(server):
+    url = server.signed_url("originals/page 1.png", url_expiry())
+    status, headers, body = fetch(url)
+    assert (status, body) == (200, b"\x89PNG page one")
+    assert headers["Content-Type"] == "image/png"
+    assert "max-age=" in headers["Cache-Control"] and "private" in headers["Cache-Control"]
+
+    status, _, body = fetch(url, {"If-None-Match": headers["ETag"]})
+    assert (status, body) == (304, None)
+
+
+def test_unsigned_tampered_and_expired_urls_are_rejected(server):
+    url = server.signed_url("originals/page 1.png", url_expiry())
+    assert fetch(url.replace("sig=", "sig=0"))[0] == 403
+    assert fetch(url.split("?")[0])[0] == 403
+    assert fetch(url.replace("page%201", "page%202"))[0] == 403
+    assert fetch(server.signed_url("originals/page 1.png", int(time.time()) - 1))[0] == 403
+    # Signed but missing, or outside the storage root
+    assert fetch(server.signed_url("originals/page 2.png", url_expiry()))[0] == 404
+    assert fetch(server.signed_url("../secret.txt", url_expiry()))[0] == 404
+
+
+def test_pyramid_signature_covers_its_tiles(server, tmp_path):
+    (tmp_path / "tiles" / "page 1_files" / "11").mkdir(parents=True)
+    (tmp_path / "tiles" / "page 1.dzi").write_text("<Image/>")
+    (tmp_path / "tiles" / "page 1_files" / "11" / "0_0.jpeg").write_bytes(b"tile")
+    expires = url_expiry()
+    dzi_url = server.signed_url("tiles/page 1.dzi", expires)
+    status, headers, _ = fetch(dzi_url)
+    assert status == 200
+    assert headers["Access-Control-Allow-Origin"] == "*"
+    # OpenSeadragon requests tiles with the descriptor's query string
+    base, query = dzi_url.split("?")
+    status, _, body = fetch(base.replace(".dzi", "_files/11/0_0.jpeg") + "?" + query)
+    assert (status, body) == (200, b"tile")
+    # But not files outside that pyramid
+    assert fetch(server.url_signer.base_url + "/originals/page%201.png?" + query)[0] == 403
+    assert fetch(base.replace("page%201.dzi", "other_files/11/0_0.jpeg") + "?" + query)[0] == 403
+
+
+def test_pyramid_signature_does_not_escape_its_tiles(server, tmp_path):
+    (tmp_path / "tiles").mkdir()
+    (tmp_path / "tiles" / "page 1.dzi").write_text("<Image/>")
+    base, query = server.signed_url("tiles/page 1.dzi", url_expiry()).split("?")
+    files = base.replace(".dzi", "_files")
+    for escape in [
+        "/%2e%2e/%2e%2e/originals/page%201.png",
+        "/../../secret.txt",
+        "/11/%2e%2e/%2e%2e/%2e%2e/secret.txt",
+        "/11/0_0.jpeg/../../../../secret.txt",
+        "/%2e%2e/page%201.dzi",
+        "/notes.txt",
+    ]:
+        assert fetch(files + escape + "?" + query)[0] == 403, escape
+    # Nor does any other signed URL
+    base, query = server.signed_url("originals/page 1.png", url_expiry()).split("?")
+    assert fetch(base.replace("page%201.png", "%2e%2e/secret.txt") + "?" + query)[0] == 403
+
+
+def test_url_expiry_is_stable_within_a_window():
+    assert url_expiry(now=3600, ttl=3600) == url_expiry(now=7199, ttl=3600) == 3 * 3600
+    assert url_expiry(now=7200, ttl=3600) == 4 * 3600
+
+
+def test_signer_rejects_other_keys():
+    expires = url_expiry()
+    url = UrlSigner("http://scans", "one").sign("a.png", expires)
+    signature = url.split("sig=")[1]
+    assert UrlSigner("http://scans", "one").verify("a.png", str(expires), signature)
+    assert not UrlSigner("http://scans", "two").verify("a.png", str(expires), signature)
+    assert not UrlSigner("http://scans", "one").verify("a.png", "soon", signature)
+
+
+def test_local_storage_needs_a_server_for_urls(tmp_path):
+    with pytest.raises(NotImplementedError):
+        LocalStorage(str(tmp_path)).signed_url("a.png", url_expiry())
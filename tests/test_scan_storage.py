@@ -0,0 +1,144 @@
+import pytest
+
+from scan_storage import BlobStat, GCSStorage, LocalStorage, open_storage, storage_path
+from scans import DiskCache
+from test_scans import FakeBucket
+
+
+@pytest.fixture
+def local(tmp_path):
+    (tmp_path / "originals").mkdir()
+    (tmp_path / "originals" / "a.png").write_bytes(b"0123456789")
+    (tmp_path / "originals" / "empty.png").write_bytes(b"")
+    (tmp_path / "secret.txt").write_bytes(b"outside")
+    return LocalStorage(str(tmp_path / ""))
+
+
+@pytest.mark.parametrize("scan_path, expected", [
+    ("dataset/originals/a.png", "originals/a.png"),
+    ("/srv/archive/dataset/derivatives/w800/a.webp", "derivatives/w800/a.webp"),
+    ("originals/a.png", "originals/a.png"),
+])
+def test_storage_path(scan_path, expected):
+    assert storage_path(scan_path) == expected
+
+
+def test_local_reads(local):
+    data = local.get_bytes("originals/a.png")
+    assert isinstance(data, memoryview) and data == b"0123456789"
+    assert local.get_range("originals/a.png", 2, 5) == b"234"
+    assert local.get_range("originals/a.png", 8) == b"89"
+    assert local.get_bytes("originals/empty.png") == b""
+    stat = local.stat("originals/a.png")
+    assert stat.size == 10 and stat.version
+    assert not local.remote
+
+
+def test_local_missing_and_escaping_paths(local):
+    for path in ("originals/missing.png", "../secret.txt", "originals/../../secret.txt"):
+        with pytest.raises(FileNotFoundError):
+            local.get_bytes(path)
+    results = {path: (data, error) for path, data, error in local.get_many(
+        ["originals/a.png", "originals/missing.png"]
+    )}
+    assert results["originals/a.png"][0] == b"0123456789"
+    assert isinstance(results["originals/missing.png"][1], FileNotFoundError)
+
+
+class RangeBucket(FakeBucket):
+    def blob(self, path):
+        blob = super().blob(path)
+        download = blob.download_as_bytes
+
+        def download_as_bytes(start=None, end=None, timeout=None):
+            data = download(timeout=timeout)
+            return data[start or 0:None if end is None else end + 1]
+        blob.download_as_bytes = download_as_bytes
+        return blob
+
+
+def test_gcs_storage(tmp_path):
+    bucket = RangeBucket({"originals/a.png": b"0123456789"})
+    storage = GCSStorage(bucket, disk_cache=DiskCache(str(tmp_path)))
+    assert storage.remote and storage.name == "gs://fake-bucket"
+    assert storage.get_bytes("originals/a.png") == b"0123456789"
+    assert storage.get_range("originals/a.png", 2, 5) == b"234"
+    assert storage.get_range("originals/a.png", 5, 5) == b""
+    assert [data for _, data, _ in storage.get_many(["originals/a.png"])] == [b"0123456789"]
+    assert bucket.downloads == 2  # the batch read came from the disk cache
+    assert storage.stat("originals/a.png") == BlobStat(10, hash(b"0123456789"))
+    with pytest.raises(FileNotFoundError):
+        storage.stat("originals/missing.png")
+
+
+def test_open_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr("scan_storage.SCAN_LOCAL_ROOT", str(tmp_path))
+    storage = open_storage("local")
+    assert isinstance(storage, LocalStorage) and storage.root == str(tmp_path)
+    with pytest.raises(ValueError):
+        open_storage("ftp")
+
+
+class SigningBucket(FakeBucket):
+    """Records the arguments blobs are signed with."""
+
+    def __init__(self, blobs, credentials):
+        super().__init__(blobs)
+        self.client = type("Client", (), {"_credentials": credentials})()
+        self.signed = []
+
+    def blob(self, path):
+        blob = super().blob(path)
+
+        def generate_signed_url(**kwargs):
+            self.signed.append(kwargs)
+            return f"https://storage.example/{path}"
+        blob.generate_signed_url = generate_signed_url
+        return blob
+
+
+class MetadataCredentials:
+    """Like Cloud Run's credentials: no private key, a token after refresh()."""
+
+    def __init__(self):
+        self.token = None
+        self.service_account_email = "default"
+        self.refreshes = 0
+
+    @property
+    def valid(self):
+        return self.token is not None
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.service_account_email = "app@project.iam.gserviceaccount.com"
+
+
+def test_gcs_signed_url_without_private_key():
+    credentials = MetadataCredentials()
+    bucket = SigningBucket({"originals/a.png": b"x"}, credentials)
+    storage = GCSStorage(bucket)
+    assert storage.signed_url("originals/a.png", 1_700_000_000) == "https://storage.example/originals/a.png"
+    storage.signed_url("originals/a.png", 1_700_000_000)
+    assert credentials.refreshes == 1  # the token is reused while valid
+    for kwargs in bucket.signed:
+        assert kwargs["version"] == "v4" and kwargs["method"] == "GET"
+        assert kwargs["service_account_email"] == "app@project.iam.gserviceaccount.com"
+        assert kwargs["access_token"] == "token-1"
+
+
+def test_gcs_signed_url_with_private_key():
+    from google.auth.credentials import Signing
+
+    class KeyCredentials(Signing):
+        signer = signer_email = None
+
+        def sign_bytes(self, message):
+            return b""
+
+        service_account_email = "key@project.iam.gserviceaccount.com"
+
+    bucket = SigningBucket({"originals/a.png": b"x"}, KeyCredentials())
+    GCSStorage(bucket).signed_url("originals/a.png", 1_700_000_000)
+    assert "access_token" not in bucket.signed[0]
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+
+from scans import DiskCache, ScanCache, fetch_blobs, pick_derivative
+
+
+def test_cache_hits_and_misses():
+    cache = ScanCache(max_bytes=100)
+    assert cache.get("bucket/a.png") is None
+    cache.put("bucket/a.png", b"x" * 10)
+    assert cache.get("bucket/a.png") == b"x" * 10
+    assert cache.stats() == {
+        "entries": 1, "bytes": 10, "max_bytes": 100,
+        "hits": 1, "misses": 1, "evictions": 0,
+    }
+
+
+def test_cache_evicts_least_recently_used_within_budget():
+    cache = ScanCache(max_bytes=30)
+    cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    cache.put("c", b"c" * 10)
+    cache.get("a")  # "b" is now the least recently used
+    cache.put("d", b"d" * 10)
+    assert cache.get("b") is None
+    assert all(cache.get(key) for key in "acd")
+    assert cache.current_bytes == 30
+    assert cache.evictions == 1
+
+
+def test_cache_replaces_entries_and_skips_oversized():
+    cache = ScanCache(max_bytes=30)
+    cache.put("a", b"a" * 10)
+    cache.put("a", b"a" * 20)
+    assert cache.current_bytes == 20
+    cache.put("huge", b"h" * 31)
+    assert cache.get("huge") is None
+    assert len(cache) == 1
+
+
+def test_pick_derivative():
+    derivatives = [(1600, "w1600/a.webp"), (400, "w400/a.webp"), (800, "w800/a.webp")]
+    assert pick_derivative(derivatives, 800) == "w800/a.webp"
+    assert pick_derivative(derivatives, 500) == "w800/a.webp"
+    assert pick_derivative(derivatives, 2000) is None
+    assert pick_derivative([], 800) is None
+
+
+class FakeBucket:
+    """Stands in for a GCS bucket: serves blobs from a dict with a fixed latency."""
+
+    name = "fake-bucket"
+
+    def __init__(self, blobs, latency=0.0):
+        self.blobs = blobs
+        self.latency = latency
+        self.downloads = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def blob(self, path):
+        return FakeBlob(self, path)
+
+    def get_blob(self, path, timeout=None):
+        if path not in self.blobs:
+            return None
+        # Stand in for the GCS generation: it changes whenever the content does
+        return FakeBlob(self, path, generation=hash(self.blobs[path]))
+
+
+class FakeBlob:
+    def __init__(self, bucket, path, generation=None):
+        self.bucket = bucket
+        self.path = path
+        self.generation = generation
+        self.etag = None
+        self.size = len(bucket.blobs[path]) if path in bucket.blobs else None
+
+    def download_as_bytes(self, timeout=None):
+        bucket = self.bucket
+        with bucket.lock:
+            bucket.active += 1
+            bucket.downloads += 1
+            bucket.max_active = max(bucket.max_active, bucket.active)
+        try:
+            time.sleep(bucket.latency)
+            if self.path not in bucket.blobs:
+                raise FileNotFoundError(self.path)
+            return bucket.blobs[self.path]
+        finally:
+            with bucket.lock:
+                bucket.active -= 1
+
+
+def test_fetch_blobs_downloads_in_parallel():
+    blobs = {f"originals/page{i}.png": bytes([i]) for i in range(6)}
+    bucket = FakeBucket(blobs, latency=0.2)
+    start = time.perf_counter()
+    results = list(fetch_blobs(bucket, list(blobs), max_workers=3))
+    elapsed = time.perf_counter() - start
+
+    assert {path: data for path, data, _ in results} == blobs
+    assert bucket.max_active == 3
+    assert elapsed < 0.2 * 6 / 2  # two waves of three, not six serial downloads
+
+
+def test_fetch_blobs_reports_errors_per_blob():
+    bucket = FakeBucket({"originals/a.png": b"a"})
+    results = {path: (data, error) for path, data, error in fetch_blobs(
+        bucket, ["originals/a.png", "originals/missing.png"]
+    )}
+    assert results["originals/a.png"] == (b"a", None)
+    assert isinstance(results["originals/missing.png"][1], FileNotFoundError)
+    assert list(fetch_blobs(bucket, [])) == []
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    assert cache.get("bucket/a.png", 1) is None
+    cache.put("bucket/a.png", 1, b"page one")
+    assert cache.get("bucket/a.png", 1) == b"page one"
+    # A new generation is a different entry
+    assert cache.get("bucket/a.png", 2) is None
+    cache.put("bucket/empty.png", 1, b"")
+    assert cache.get("bucket/empty.png", 1) == b""
+    assert not [p for p in tmp_path.rglob(".tmp-*")]
+    assert cache.stats()["hits"] == 2
+
+
+def test_disk_cache_reads_are_mapped(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    cache.put("bucket/a.png", 1, b"page one")
+    data = cache.get("bucket/a.png", 1)
+    assert isinstance(data, memoryview) and data.readonly
+    # Still readable once another process evicts the file
+    for path in tmp_path.rglob("*"):
+        if path.is_file():
+            path.unlink()
+    assert bytes(data) == b"page one"
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=100)
+    for i, key in enumerate("abc"):
+        cache.put(key, 1, b"x" * 30)
+        # Distinct mtimes without sleeping
+        os.utime(cache._path(key, 1), (1000 + i, 1000 + i))
+    cache.get("a", 1)  # touches "a", so "b" is now the oldest
+    cache.put("d", 1, b"x" * 30)  # over budget: evicts down to 90 bytes
+    assert cache.get("b", 1) is None
+    assert all(cache.get(key, 1) for key in "acd")
+    assert cache.stats()["approx_bytes"] == 90
+    assert cache.stats()["evictions"] == 1
+
+
+def test_fetch_blobs_serves_unchanged_blobs_from_disk(tmp_path):
+    bucket = FakeBucket({"originals/a.png": b"v1"})
+    disk_cache = DiskCache(str(tmp_path))
+    for _ in range(2):
+        [(_, data, error)] = fetch_blobs(bucket, ["originals/a.png"], disk_cache=disk_cache)
+        assert (data, error) == (b"v1", None)
+    assert bucket.downloads == 1
+
+    bucket.blobs["originals/a.png"] = b"v2"
+    [(_, data, _)] = fetch_blobs(bucket, ["originals/a.png"], disk_cache=disk_cache)
+    assert data == b"v2"
+    assert bucket.downloads == 2
+
+
+def png_bytes():
+    from io import BytesIO
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new("L", (4, 4)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_app_serves_repeat_views_from_memory(monkeypatch):
+    import app
+    from scan_storage import GCSStorage
+    bucket = FakeBucket({"originals/a.png": png_bytes()})
+    cache = ScanCache()
+    monkeypatch.setattr(app, "get_scan_storage", lambda: GCSStorage(bucket))
+    monkeypatch.setattr(app, "get_scan_cache", lambda: cache)
+    for _ in range(3):
+        [(path, image)] = app.fetch_scans(["originals/a.png"])
+        assert path == "originals/a.png" and image.size == (4, 4)
+    assert bucket.downloads == 1
+    assert cache.stats()["entries"] == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_app_copies_disk_cache_hits_into_memory(monkeypatch, tmp_path):
+    import app
+    from scan_storage import GCSStorage
+    bucket = FakeBucket({"originals/a.png": png_bytes()})
+    disk_cache = DiskCache(str(tmp_path))
+    list(fetch_blobs(bucket, ["originals/a.png"], disk_cache=disk_cache))
+    cache = ScanCache()
+    monkeypatch.setattr(app, "get_scan_storage", lambda: GCSStorage(bucket, disk_cache=disk_cache))
+    monkeypatch.setattr(app, "get_scan_cache", lambda: cache)
+    list(app.fetch_scans(["originals/a.png"]))
+    assert disk_cache.hits == 1
+    # Not a view of the mapped file, which would hold its descriptor open
+    assert type(cache.get(f"gs://{bucket.name}/originals/a.png")) is bytes
+
+
+def test_app_falls_back_to_the_original(monkeypatch):
+    import app
+    from scan_storage import GCSStorage
+    bucket = FakeBucket({"originals/a.png": png_bytes()})
+    monkeypatch.setattr(app, "get_scan_storage", lambda: GCSStorage(bucket))
+    monkeypatch.setattr(app, "get_scan_cache", lambda: ScanCache())
+    [(path, image)] = app.fetch_scans(["derivatives/w800/a.webp"],
+                                      fallbacks={"derivatives/w800/a.webp": "originals/a.png"})
+    assert path == "derivatives/w800/a.webp" and image.size == (4, 4)
@@ -0,0 +1,314 @@
+import sqlite3
+
+import pytest
+
+from init_db import import_letters, init_db
+from search import (
+    MARK_END, MARK_START, build_count_query, build_highlight_query, build_search_query,
+    build_timeline_query, build_vocab_query, closest_terms, edit_distance, expand_fuzzy_query,
+    build_suggestion_query, fuzzy_distance, fuzzy_terms, incremental_query, last_word_prefix, snippet_html,
+    to_fts_query, to_substring_query,
+)
+
+LETTERS = {
+    "1943-01-15 Letter from Harold to Ruth.txt": "Dear Ruth, the training camp is cold but the food is good.",
+    "1943-06 Letter from Ruth to Harold.txt": "Dear Harold, the garden is full of tomatoes this summer.",
+    "1944-03-02 Postcard from Harold.txt": "Greetings from the coast. Training is over, shipping out soon.",
+}
+
+
+@pytest.fixture
+def letters_db(tmp_path):
+    """Build a small archive with the real import pipeline."""
+    text_dir = tmp_path / "text"
+    scan_dir = tmp_path / "originals"
+    text_dir.mkdir()
+    scan_dir.mkdir()
+    for name, body in LETTERS.items():
+        (text_dir / name).write_text(body, encoding="utf-8")
+
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(scan_dir), db_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def run(conn, search_query, start="1900-01-01", end="2000-01-01", order_by="date", match_mode="words"):
+    query, params = build_search_query(search_query, start, end, order_by, match_mode=match_mode)
+    return [row["description"] for row in conn.execute(query, params)]
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("training", '"training"'),
+    ("train*", '"train"*'),
+    ('"training camp"', '"training camp"'),
+    ("garden OR coast", '"garden" OR "coast"'),
+    ("Harold NOT garden", '"Harold" NOT "garden"'),
+    ("Ruth (garden OR camp)", '"Ruth" AND ( "garden" OR "camp" )'),
+    ("OR camp AND", '"camp"'),
+    ("camp's (", '"camp\'s"'),
+    ("and or", '"and" "or"'),
+    ("( )", ""),
+])
+def test_to_fts_query(raw, expected):
+    assert to_fts_query(raw) == expected
+
+
+def test_search_uses_fts_index(letters_db):
+    query, params = build_search_query("training", "1900-01-01", "2000-01-01")
+    plan = " ".join(row[3] for row in letters_db.execute(f"EXPLAIN QUERY PLAN {query}", params))
+    assert "letters_fts" in plan
+    assert "LIKE" not in query
+
+
+def test_search_syntax(letters_db):
+    assert run(letters_db, "training") == ["Postcard from Harold", "Letter from Harold to Ruth"]
+    assert run(letters_db, "tomato*") == ["Letter from Ruth to Harold"]
+    assert run(letters_db, '"training camp"') == ["Letter from Harold to Ruth"]
+    assert run(letters_db, "garden OR coast") == ["Postcard from Harold", "Letter from Ruth to Harold"]
+    assert run(letters_db, "Harold NOT Ruth") == ["Postcard from Harold"]
+    assert run(letters_db, "((") == []
+
+
+def test_search_applies_date_filter(letters_db):
+    assert run(letters_db, "training", start="1943-01-01", end="1943-12-31") == [
+        "Letter from Harold to Ruth"
+    ]
+    # YYYY-MM filenames are stored on the first of the month
+    assert run(letters_db, "", start="1943-06-01", end="1943-06-01") == ["Letter from Ruth to Harold"]
+
+
+def test_relevance_order(letters_db):
+    # Only the letter to Harold mentions him in both description and body
+    ranked = run(letters_db, "Harold", order_by="relevance")
+    assert len(ranked) == 3
+    assert ranked[0] == "Letter from Ruth to Harold"
+
+
+def fetch_all_pages(conn, search_query, order_by, page_size):
+    pages, after = [], None
+    while True:
+        query, params = build_search_query(
+            search_query, "1900-01-01", "2000-01-01", order_by, after=after, page_size=page_size
+        )
+        rows = conn.execute(query, params).fetchall()
+        pages.append([row["description"] for row in rows[:page_size]])
+        if len(rows) <= page_size:
+            return pages
+        after = (rows[page_size - 1]["sort_key"], rows[page_size - 1]["id"])
+
+
+@pytest.mark.parametrize("search_query, order_by", [
+    ("", "date"), ("Harold", "date"), ("Harold", "relevance"),
+])
+def test_keyset_pagination(letters_db, search_query, order_by):
+    everything = run(letters_db, search_query, order_by=order_by)
+    pages = fetch_all_pages(letters_db, search_query, order_by, page_size=2)
+    assert [len(page) for page in pages] == [2, 1]
+    assert sum(pages, []) == everything
+
+
+def test_count_query(letters_db):
+    def count(search_query, start="1900-01-01", end="2000-01-01"):
+        query, params = build_count_query(search_query, start, end)
+        return letters_db.execute(query, params).fetchone()[0]
+
+    assert count("") == 3
+    assert count("training") == 2
+    assert count("training", end="1943-12-31") == 1
+    assert count("((") == 0
+
+
+@pytest.mark.parametrize("search_query", ["", "training"])
+def test_list_query_selects_only_metadata(letters_db, search_query):
+    query, params = build_search_query(search_query, "1900-01-01", "2000-01-01")
+    cursor = letters_db.execute(query, params)
+    columns = [column[0] for column in cursor.description]
+    assert columns == ["id", "date", "date_precision", "description", "sort_key", "snippet"]
+
+
+def test_snippets_mark_matches(letters_db):
+    query, params = build_search_query("training", "1900-01-01", "2000-01-01")
+    rows = letters_db.execute(query, params).fetchall()
+    assert [row["description"] for row in rows] == run(letters_db, "training")
+    for row in rows:
+        assert f"{MARK_START}training{MARK_END}" in row["snippet"].lower()
+    assert "<mark>training</mark>" in snippet_html(rows[0]["snippet"]).lower()
+
+    query, params = build_search_query("", "1900-01-01", "2000-01-01")
+    assert all(row["snippet"] is None for row in letters_db.execute(query, params))
+
+
+def test_highlight_query(letters_db):
+    [letter_id] = [row["id"] for row in letters_db.execute(
+        "SELECT id FROM letters WHERE description LIKE '%Ruth to Harold%'"
+    )]
+    query, params = build_highlight_query("garden OR tomato*", letter_id)
+    [(text,)] = letters_db.execute(query, params).fetchall()
+    assert f"{MARK_START}garden{MARK_END}" in text
+    assert f"{MARK_START}tomatoes{MARK_END}" in text
+    query, params = build_highlight_query("coast", letter_id)
+    assert letters_db.execute(query, params).fetchall() == []
+
+
+def timeline(conn, search_query, granularity="year", first=None, last=None, senders=()):
+    query, params = build_timeline_query(search_query, granularity, first, last, senders)
+    return [tuple(row) for row in conn.execute(query, params)]
+
+
+def test_timeline_query(letters_db):
+    # Browsing reads the summary table init_db.py keeps
+    assert timeline(letters_db, "") == [("1943", 2), ("1944", 1)]
+    assert timeline(letters_db, "", "month", "1943-01", "1943-12") == [("1943-01", 1), ("1943-06", 1)]
+    # Searches group their FTS hits
+    assert timeline(letters_db, "training") == [("1943", 1), ("1944", 1)]
+    assert timeline(letters_db, "training OR garden", "month", "1943-01", "1943-12") == [
+        ("1943-01", 1), ("1943-06", 1)
+    ]
+    assert timeline(letters_db, "zeppelin") == []
+    assert timeline(letters_db, "!!!") == []
+
+
+def test_timeline_counts_follow_reimport(tmp_path):
+    text_dir = tmp_path / "text"
+    text_dir.mkdir()
+    for name, body in LETTERS.items():
+        (text_dir / name).write_text(body, encoding="utf-8")
+    db_path = tmp_path / "letters.db"
+    init_db(db_path)
+    import_letters(str(text_dir), str(tmp_path), db_path)
+    (text_dir / "1944-03-02 Postcard from Harold.txt").unlink()
+    (text_dir / "1945-05-08 Telegram from Harold.txt").write_text("Coming home", encoding="utf-8")
+    import_letters(str(text_dir), str(tmp_path), db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert timeline(conn, "") == [("1943", 2), ("1945", 1)]
+    assert timeline(conn, "", "month", "1945-01", "1945-12") == [("1945-05", 1)]
+    conn.close()
+
+
+def test_correspondent_filters(letters_db):
+    people = dict(letters_db.execute("SELECT name, id FROM people"))
+    harold, ruth = people["Harold"], people["Ruth"]
+
+    def filtered(search_query="", senders=(), recipients=()):
+        query, params = build_search_query(search_query, "1900-01-01", "2000-01-01",
+                                           senders=senders, recipients=recipients)
+        count_query, count_params = build_count_query(search_query, "1900-01-01", "2000-01-01",
+                                                      senders, recipients)
+        rows = [row["description"] for row in letters_db.execute(query, params)]
+        assert letters_db.execute(count_query, count_params).fetchone()[0] == len(rows)
+        return rows
+
+    assert filtered(senders=(harold,)) == ["Postcard from Harold", "Letter from Harold to Ruth"]
+    assert filtered(senders=(harold,), recipients=(ruth,)) == ["Letter from Harold to Ruth"]
+    assert filtered(senders=(harold, ruth)) == run(letters_db, "")
+    assert filtered("garden", senders=(harold,)) == []
+    assert filtered("training", recipients=(ruth,)) == ["Letter from Harold to Ruth"]
+
+    assert timeline(letters_db, "", senders=(harold,)) == [("1943", 1), ("1944", 1)]
+    query, params = build_timeline_query("", senders=(harold,))
+    plan = " ".join(row[3] for row in letters_db.execute("EXPLAIN QUERY PLAN " + query, params))
+    assert "idx_letter_people_person" in plan
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("arden", '"arden"'),
+    ('rain "amp is" OR to', '"rain" AND "amp is"'),
+    ("tomat* NOT", '"tomat"'),
+    ("is a", ""),
+])
+def test_to_substring_query(raw, expected):
+    assert to_substring_query(raw) == expected
+
+
+def test_substring_search(letters_db):
+    query, params = build_search_query("arden", "1900-01-01", "2000-01-01", match_mode="substring")
+    plan = " ".join(row[3] for row in letters_db.execute(f"EXPLAIN QUERY PLAN {query}", params))
+    assert "letters_trigram" in plan
+
+    # Inside words, where the word index finds nothing
+    assert run(letters_db, "arden") == []
+    assert run(letters_db, "arden", match_mode="substring") == ["Letter from Ruth to Harold"]
+    assert sorted(run(letters_db, "rain", order_by="relevance", match_mode="substring")) == [
+        "Letter from Harold to Ruth", "Postcard from Harold",
+    ]
+    query, params = build_count_query("hipp", "1900-01-01", "2000-01-01", match_mode="substring")
+    assert letters_db.execute(query, params).fetchone()[0] == 1
+
+    query, params = build_highlight_query("omato", 2, match_mode="substring")
+    (highlighted,) = letters_db.execute(query, params).fetchone()
+    assert f"t{MARK_START}omato{MARK_END}es" in highlighted
+
+    # Trigram excerpts are as long as word ones, not a couple of dozen characters
+    query, params = build_search_query("arden", "1900-01-01", "2000-01-01", match_mode="substring")
+    (row,) = letters_db.execute(query, params).fetchall()
+    assert snippet_html(row["snippet"]) == (
+        "Dear Harold, the g<mark>arden</mark> is full of tomatoes this summer."
+    )
+
+
+def test_edit_distance():
+    assert edit_distance("tomatos", "tomatoes", 2) == 1
+    assert edit_distance("kitten", "sitting", 3) == 3
+    # Gives up once past the limit
+    assert edit_distance("kitten", "sitting", 1) == 2
+    assert edit_distance("camp", "coastline", 2) == 3
+    assert [fuzzy_distance(term) for term in ("the", "camp", "harvest")] == [0, 1, 2]
+
+
+def test_fuzzy_expansion(letters_db):
+    def expand(term):
+        distance = fuzzy_distance(term)
+        query, params = build_vocab_query(term, distance)
+        return closest_terms(term, letters_db.execute(query, params).fetchall(), distance)
+
+    assert expand("tomatos") == ["tomatoes"]
+    # The exact word first, then close ones
+    assert expand("training") == ["training"]
+    assert expand("trainign") == ["training"]
+    assert expand("zzzz") == []
+    # Candidates share the first letter
+    assert expand("gamp") == []
+
+    assert fuzzy_terms('tomatos "training camp" OR cost*') == ["tomatos"]
+    rewritten = expand_fuzzy_query("Ruth tomatos", {"ruth": ["ruth"], "tomatos": ["tomatoes", "tomato"]})
+    assert rewritten == "ruth (tomatos OR tomatoes OR tomato)"
+    assert run(letters_db, rewritten) == ["Letter from Ruth to Harold"]
+    assert expand_fuzzy_query('"traning camp" OR cost*', {}) == '"traning camp" OR cost*'
+
+
+@pytest.mark.parametrize("typed, query, prefix", [
+    ("tra", "tra*", "tra"),
+    ("Training ca", "Training ca*", "ca"),
+    # Too short to complete yet: searched without it
+    ("training c", "training ", ""),
+    ("t", "", ""),
+    # Finished words, phrases, prefixes and operators are searched as typed
+    ("training ", "training ", ""),
+    ('"training camp"', '"training camp"', ""),
+    ("tomat*", "tomat*", ""),
+    ("garden OR", "garden OR", ""),
+    ("(garden OR coa", "(garden OR coa*", "coa"),
+])
+def test_incremental_query(typed, query, prefix):
+    assert incremental_query(typed) == query
+    assert last_word_prefix(typed) == prefix
+
+
+def test_search_as_you_type(letters_db):
+    assert run(letters_db, incremental_query("tra")) == ["Postcard from Harold", "Letter from Harold to Ruth"]
+    assert run(letters_db, incremental_query("garden tom")) == ["Letter from Ruth to Harold"]
+
+    def suggest(prefix, limit=8):
+        query, params = build_suggestion_query(prefix, limit)
+        return [tuple(row) for row in letters_db.execute(query, params)]
+
+    # Most letters first, then alphabetical
+    assert suggest("tr") == [("training", 2)]
+    assert suggest("co") == [("coast", 1), ("cold", 1)]
+    assert suggest("harold", 1) == [("harold", 3)]
+    assert suggest("zz") == []
@@ -0,0 +1,88 @@
+import json
+import threading
+
+from tracing import JsonLinesExporter, LatencyHistogram, Tracer
+
+
+def test_spans_nest_under_the_current_trace(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer([JsonLinesExporter(str(path))])
+    with tracer.trace("rerun", session_id="abc"):
+        with tracer.span("query", search=True):
+            with tracer.span("query.sql"):
+                pass
+        with tracer.span("render"):
+            tracer.record("image_fetch", 0.25, source="remote")
+
+    [trace] = [json.loads(line) for line in path.read_text().splitlines()]
+    assert trace["session_id"] == "abc"
+    root = trace["root"]
+    assert root["name"] == "rerun"
+    query, render = root["children"]
+    assert query["attrs"] == {"search": True}
+    assert [child["name"] for child in query["children"]] == ["query.sql"]
+    assert render["children"][0]["duration_ms"] == 250.0
+    assert root["duration_ms"] >= render["duration_ms"] >= 0
+    assert tracer.percentiles()["image_fetch"]["count"] == 1
+
+
+def test_traces_are_separate_per_thread():
+    tracer = Tracer()
+    roots = {}
+
+    def rerun(name):
+        with tracer.trace("rerun") as root:
+            with tracer.span(name):
+                pass
+        roots[name] = root
+
+    threads = [threading.Thread(target=rerun, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [span.name for span in roots["a"].children] == ["a"]
+    assert [span.name for span in roots["b"].children] == ["b"]
+
+
+def test_spans_outside_a_trace_still_feed_histograms():
+    tracer = Tracer()
+    with tracer.span("outer"):
+        with tracer.span("inner"):
+            pass
+
+    @tracer.traced()
+    def decorated():
+        return 42
+
+    assert decorated() == 42
+    assert set(tracer.percentiles()) == {"outer", "inner", "decorated"}
+
+
+def test_histogram_quantiles_use_a_rolling_window():
+    histogram = LatencyHistogram(window=100)
+    for ms in range(1, 201):
+        histogram.add(ms / 1000)
+    # Only the last 100 samples (101..200 ms) count towards the quantiles
+    assert histogram.quantile(0.5) == 0.150
+    assert histogram.quantile(0.99) == 0.199
+    assert histogram.count == 200
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_prometheus_text():
+    tracer = Tracer()
+    tracer.record("query", 0.5)
+    tracer.record('we"ird', 1.0)
+    text = tracer.prometheus_text()
+    assert '# TYPE letters_span_duration_seconds summary' in text
+    assert 'letters_span_duration_seconds{span="query",quantile="0.95"} 0.500000' in text
+    assert 'letters_span_duration_seconds_count{span="query"} 1' in text
+    assert 'span="we\\"ird"' in text
+
+
+def test_export_errors_do_not_break_the_trace(tmp_path):
+    tracer = Tracer([JsonLinesExporter(str(tmp_path / "missing" / "traces.jsonl"))])
+    with tracer.trace("rerun"):
+        pass
+    assert tracer.export_errors == 1
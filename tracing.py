@@ -0,0 +1,277 @@
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Where finished traces and latency summaries go; unset means keep them in
+# memory only (the debug sidebar still shows them).
+TRACE_JSONL_PATH = os.getenv('TRACE_JSONL_PATH')
+TRACE_PROMETHEUS_PATH = os.getenv('TRACE_PROMETHEUS_PATH')
+TRACE_PROMETHEUS_PORT = int(os.getenv('TRACE_PROMETHEUS_PORT', '0'))
+
+# Latency percentiles are computed over this many recent samples per span name
+TRACE_WINDOW = int(os.getenv('TRACE_WINDOW', '1024'))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed operation; spans opened while it is running become its children."""
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.children = []
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self, origin=None):
+        origin = self.start if origin is None else origin
+        span = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 3),
+        }
+        if self.attrs:
+            span['attrs'] = self.attrs
+        if self.children:
+            span['children'] = [child.to_dict(origin) for child in self.children]
+        return span
+
+
+class LatencyHistogram:
+    """Rolling window of recent durations for one span name, plus lifetime totals."""
+
+    def __init__(self, window=TRACE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, duration):
+        self.samples.append(duration)
+        self.count += 1
+        self.total += duration
+
+    def quantile(self, q):
+        """Nearest-rank quantile of the window, in seconds."""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+class JsonLinesExporter:
+    """Append every finished trace to a file as one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, tracer, trace):
+        line = json.dumps(trace, ensure_ascii=False)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class PrometheusFileExporter:
+    """Rewrite a Prometheus text-format file, e.g. for node_exporter's textfile collector.
+
+    The file is written at most every ``interval`` seconds and atomically
+    replaced, so a scraper never reads half of it.
+    """
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def export(self, tracer, trace):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_write < self.interval:
+                return
+            self._last_write = now
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(tracer.prometheus_text())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def serve_prometheus(tracer, port, host='0.0.0.0'):
+    """Serve ``tracer``'s metrics at ``/metrics`` from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would drown the app log
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='prometheus-metrics').start()
+    return server
+
+
+class Tracer:
+    """Collects one trace per rerun and rolling latency percentiles per span name.
+
+    A trace is a tree of ``Span`` objects rooted at the span opened by
+    ``trace()``; ``span()`` anywhere below it, in the same thread, nests
+    under whatever span is currently open. When the root closes, every
+    span's duration is added to its name's histogram and the trace is
+    handed to each exporter. Spans opened outside a trace still feed the
+    histograms. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, exporters=(), window=TRACE_WINDOW):
+        self.exporters = list(exporters)
+        self.window = window
+        self.histograms = {}
+        self.export_errors = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name, session_id=None, **attrs):
+        """Open the root span of a new trace and export it once it closes."""
+        trace_id = uuid.uuid4().hex
+        started_at = time.time()
+        root = Span(name, attrs)
+        token = _current_span.set(root)
+        try:
+            yield root
+        finally:
+            root.duration = time.perf_counter() - root.start
+            _current_span.reset(token)
+            self._record(root.walk())
+            trace = {
+                'trace_id': trace_id,
+                'session_id': session_id,
+                'timestamp': started_at,
+                'root': root.to_dict(),
+            }
+            for exporter in self.exporters:
+                try:
+                    exporter.export(self, trace)
+                except Exception:
+                    # Never let a full disk or a bad path break the page
+                    with self._lock:
+                        self.export_errors += 1
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """Time a block as a child of the current span."""
+        parent = _current_span.get()
+        span = Span(name, attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            if parent is not None:
+                parent.children.append(span)
+            else:
+                self._record(span.walk())
+
+    def record(self, name, duration, **attrs):
+        """Add an already measured span, for work that cannot sit inside a ``with``."""
+        span = Span(name, attrs)
+        span.start -= duration
+        span.duration = duration
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(span)
+        else:
+            self._record([span])
+
+    def traced(self, name=None):
+        """Decorator form of ``span()``, named after the function by default."""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _record(self, spans):
+        with self._lock:
+            for span in spans:
+                histogram = self.histograms.get(span.name)
+                if histogram is None:
+                    histogram = self.histograms[span.name] = LatencyHistogram(self.window)
+                histogram.add(span.duration)
+
+    def percentiles(self):
+        """``{span name: {count, p50_ms, p95_ms, p99_ms}}`` over the rolling window."""
+        with self._lock:
+            summary = {}
+            for name, histogram in sorted(self.histograms.items()):
+                summary[name] = {'count': histogram.count}
+                for q in QUANTILES:
+                    summary[name][f'p{round(q * 100)}_ms'] = round(histogram.quantile(q) * 1000, 3)
+            return summary
+
+    def prometheus_text(self):
+        """Latency summaries per span name in the Prometheus text exposition format."""
+        lines = [
+            '# HELP letters_span_duration_seconds Duration of traced operations.',
+            '# TYPE letters_span_duration_seconds summary',
+        ]
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                for q in QUANTILES:
+                    lines.append(
+                        f'letters_span_duration_seconds{{span="{label}",quantile="{q}"}} '
+                        f'{histogram.quantile(q):.6f}'
+                    )
+                lines.append(f'letters_span_duration_seconds_sum{{span="{label}"}} {histogram.total:.6f}')
+                lines.append(f'letters_span_duration_seconds_count{{span="{label}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def tracer_from_env():
+    """A ``Tracer`` exporting wherever the TRACE_* environment variables say."""
+    exporters = []
+    if TRACE_JSONL_PATH:
+        exporters.append(JsonLinesExporter(TRACE_JSONL_PATH))
+    if TRACE_PROMETHEUS_PATH:
+        exporters.append(PrometheusFileExporter(TRACE_PROMETHEUS_PATH))
+    tracer = Tracer(exporters)
+    if TRACE_PROMETHEUS_PORT:
+        serve_prometheus(tracer, TRACE_PROMETHEUS_PORT)
+    return tracer